@@ -7,8 +7,8 @@ import random
 import matplotlib.colors as mcolors
 import matplotlib.pyplot as plt
 
-from hydra.utils import instantiate, call
-from omegaconf import DictConfig
+from hydra.utils import call
+from omegaconf import DictConfig, OmegaConf
 from pathlib import Path
 from typing import *
 from colorcet import OrderedDict
@@ -40,7 +40,12 @@ def generate_test_groups(
         lens_mean_normal_group,
         lens_std_normal_group,
         density_group,
+        model: Dict = None,
 ):
+    """
+    :param model: fixed options of `generate_random_processes` added to every group, e.g. heavy tailed lengths
+        or bursty arrivals.
+    """
     params_group = OrderedDict(
         n_processes=n_processes_group,
         lens_mean_normal=lens_mean_normal_group,
@@ -54,12 +59,12 @@ def generate_test_groups(
         groups_remain.pop(name)
         keys = list(groups_remain.keys())
         for a, b, c in itertools.product(*[g for g in groups_remain.values()]):
-            variable_groups[name].append(({keys[0]: a, keys[1]: b, keys[2]: c}, group))
+            variable_groups[name].append(({keys[0]: a, keys[1]: b, keys[2]: c} | dict(model or {}), group))
 
     return variable_groups
 
 
-def plot(metrics_result, var_name, var, path):
+def plot(metrics_result, var_name, var, path, intervals=None):
     x = range(len(var)) # The varying parameter, e.g., task counts
     algorithms = metrics_result.keys()
     metrics = {
@@ -67,10 +72,20 @@ def plot(metrics_result, var_name, var, path):
         'PRIO_RT & RT': ['prio_RT', 'RT'],
         'PRIO_TAT_NORM & TAT_NORM': ['prio_TAT_Norm', 'TAT_Norm'],
         'PRIO_RT_NORM & RT_NORM': ['prio_RT_Norm', 'RT_Norm'],
-        'SCHEDULE_TIMES': ['schedule_times']
+        'SCHEDULE_TIMES': ['schedule_times'],
+        'PRIO_RT_P99 & RT_P99': ['prio_RT_p99', 'RT_p99'],
+        'SCHEDULE_US_P99 & SCHEDULE_US_P50': ['schedule_us_p99', 'schedule_us_p50'],
+        'TICK_US_P99 & TICK_US_P50': ['tick_us_p99', 'tick_us_p50'],
+        'MIGRATIONS & STEALS': ['migrations', 'steals'],
+        'CORE_UTILIZATION MIN & MAX': ['core_utilization_min', 'core_utilization_max'],
+        'OVERHEAD_TICKS': ['overhead_ticks'],
     }
+    # wall time, per-core and overhead panels only exist for profiled / per-core / cost-model runs.
+    first = next(iter(metrics_result.values()))[0]
+    metrics = {k: v for k, v in metrics.items() if all(key in first for key in v)}
     # Plot
-    fig, axes = plt.subplots(3, 2, figsize=(15, 18))
+    n_rows = (len(metrics) + 1) // 2
+    fig, axes = plt.subplots(n_rows, 2, figsize=(15, 6 * n_rows))
     axes = axes.flatten()
 
     colors_to_use = random.sample(list(mcolors.TABLEAU_COLORS.keys()), len(algorithms))
@@ -79,15 +94,20 @@ def plot(metrics_result, var_name, var, path):
         ax = axes[idx]
         for i, algo in enumerate(algorithms):
             values = metrics_result[algo]
+            # half widths of the confidence intervals of the means, as error bars.
+            err = lambda key: [v[key] for v in intervals[algo]] if intervals else None
             if len(metric_keys) == 2:  # For dual metrics
                 y1 = [v[metric_keys[0]] for v in values]
                 y2 = [v[metric_keys[1]] for v in values]
 
-                ax.plot(x, y1, label=f'{algo} - {metric_keys[0]}', marker='o', color=colors_to_use[i])
-                ax.plot(x, y2, label=f'{algo} - {metric_keys[1]}', linestyle='--', marker='x', color=colors_to_use[i])
+                ax.errorbar(x, y1, yerr=err(metric_keys[0]), capsize=3,
+                            label=f'{algo} - {metric_keys[0]}', marker='o', color=colors_to_use[i])
+                ax.errorbar(x, y2, yerr=err(metric_keys[1]), capsize=3,
+                            label=f'{algo} - {metric_keys[1]}', linestyle='--', marker='x', color=colors_to_use[i])
             else:  # Single metric
                 y = [v[metric_keys[0]] for v in values]
-                ax.plot(x, y, label=f'{algo} - {metric_keys[0]}', marker='o', color=colors_to_use[i])
+                ax.errorbar(x, y, yerr=err(metric_keys[0]), capsize=3,
+                            label=f'{algo} - {metric_keys[0]}', marker='o', color=colors_to_use[i])
 
         ax.set_title(metric_name.replace('_', ' '))
         ax.set_xlabel(var_name)
@@ -106,47 +126,112 @@ def plot(metrics_result, var_name, var, path):
     plt.savefig(path)
 
 
+def plot_profile(metrics_result, var_name, var, path):
+    """
+    wall time of `schedule` in profiled runs, per scheduler at the last value of the sweep: how its calls spread
+    over log2 time bins, and how the mean grows with the ready queue.
+    """
+    first = next(iter(metrics_result.values()))[-1]
+    hist_keys = sorted((k for k in first if k.startswith('schedule_hist_')), key=lambda k: int(k.rsplit('_', 1)[1]))
+    qlen_keys = sorted((k for k in first if k.startswith('schedule_us_qlen_')), key=lambda k: int(k.rsplit('_', 1)[1]))
+    fig, axes = plt.subplots(1, 2, figsize=(15, 6))
+    for algo, values in metrics_result.items():
+        last = values[-1]
+        axes[0].plot([2 ** int(k.rsplit('_', 1)[1]) / 1e3 for k in hist_keys], [last[k] for k in hist_keys],
+                     label=algo, marker='o')
+        # queue length 0 can't sit on a log axis, start at 1.
+        axes[1].plot([int(k.rsplit('_', 1)[1]) for k in qlen_keys[1:]], [last[k] for k in qlen_keys[1:]],
+                     label=algo, marker='o')
+    axes[0].set_xscale('log', base=2)
+    axes[0].set_title(f'SCHEDULE US HISTOGRAM, {var_name}={var[-1]}')
+    axes[0].set_xlabel('schedule wall time (us, lower bin edge)')
+    axes[0].set_ylabel('share of calls')
+    axes[1].set_xscale('log', base=2)
+    axes[1].set_title(f'SCHEDULE US BY READY QUEUE LENGTH, {var_name}={var[-1]}')
+    axes[1].set_xlabel('ready queue length (lower bound)')
+    axes[1].set_ylabel('mean schedule wall time (us)')
+    for ax in axes:
+        ax.legend()
+        ax.grid()
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close(fig)
+
+
 @hydra.main(version_base=None, config_path=CONFIG_PATH, config_name=CONFIG_NAME)
 def main(cfg: DictConfig):
     log_path = Path(cfg.exp.save_dir).joinpath(cfg.exp.uuid)
     Path(log_path).mkdir(exist_ok=True, parents=False)
 
-    test_groups = call(cfg.test_groups)
+    schedulers = OmegaConf.to_container(cfg.schedulers, resolve=True)
+    virtual_env = OmegaConf.to_container(cfg.virtual_env, resolve=True)
+    trace = OmegaConf.to_container(cfg.trace, resolve=True) if cfg.get('trace') and cfg.trace.path else None
+    if trace is not None:
+        # a log replays the same way every time, sweep its time scale instead of generator params.
+        test_groups = {'time_scale': [({'length_scale': trace.pop('length_scale')}, list(trace.pop('time_scale')))]}
+        n_repeats = 1
+    else:
+        test_groups = call(cfg.test_groups)
+        n_repeats = cfg.exp.n_repeats
 
+    adaptive = cfg.exp.adaptive if trace is None else None
+    # every (fixed_param, scheduler, variable value, repeat) is an independent cell.
+    sweeps, groups = [], []
     for variable_param_name, params in test_groups.items():
         for fixed_param, variable_param in params:
-            if len(variable_param) == 1 and cfg.exp.skip_single_var:
+            if len(variable_param) == 1 and cfg.exp.skip_single_var and trace is None:
                 continue
 
-            fixed_param_to_str = ''.join([f'{k}={v},' for k, v in fixed_param.items()])
-            metrics_result = OrderedDict({k: [] for k in cfg.schedulers.keys()})
-            for scheduler_name, scheduler in instantiate(cfg.schedulers).items():
-                for p in variable_param:
-                    metrics = []
-                    for _ in range(cfg.exp.n_repeats):
-                        scheduler.reset()
-                        test_processes = generate_random_processes(**(fixed_param | {variable_param_name: p}))
-                        _, metric = benchmark_single(
-                            scheduler=scheduler,
-                            test_processes=test_processes,
-                            verbose=False,
-                            n_threads=cfg.virtual_env.n_threads
-                        )
-                        metrics.append(metric)
-
-                    metric_mean = {k: sum([metric[k] for metric in metrics]) / cfg.exp.n_repeats for k in metrics[0].keys()}
-                    metrics_result[scheduler_name].append(metric_mean)
-
-            save_path = Path(log_path).joinpath(variable_param_name)
-            save_path.mkdir(exist_ok=True, parents=False)
-            plot(metrics_result, variable_param_name, variable_param, path=save_path / fixed_param_to_str.__add__('.png'))
+            sweeps.append((variable_param_name, fixed_param, variable_param))
+            # the schedulers of a group get the same seeded workloads.
+            for p in variable_param:
+                workload = fixed_param | {variable_param_name: p}
+                groups.append([dict(
+                    scheduler=scheduler,
+                    workload=workload,
+                    virtual_env=virtual_env,
+                    corpus=cfg.exp.corpus_dir,
+                    trace=trace,
+                ) for scheduler in schedulers.values()])
+
+    cache = ResultCache(Path(cfg.exp.save_dir).joinpath('cache')) if cfg.exp.cache else None
+    run_kwargs = dict(n_workers=cfg.exp.n_workers, batch_repeats=cfg.exp.batch_repeats, cache=cache)
+    if adaptive:
+        runs = run_sequential(
+            groups, base_seed=cfg.exp.seed, max_repeats=n_repeats, confidence=cfg.exp.confidence,
+            **OmegaConf.to_container(adaptive, resolve=True), **run_kwargs)
+        n_runs = sum(len(repeats) for group in runs for repeats in group)
+        print(f'{n_runs} simulations, {len(groups) * len(schedulers) * n_repeats} with fixed n_repeats.')
+    else:
+        # repeats of a cell stay next to each other for `batch_repeats`.
+        cells = [cell | dict(seed=cell_seed(cfg.exp.seed, cell['workload'], repeat))
+                 for group in groups for cell in group for repeat in range(n_repeats)]
+        results = iter(run_cells(cells, **run_kwargs))
+        runs = [[[next(results) for _ in range(n_repeats)] for _ in group] for group in groups]
+
+    runs = iter(runs)
+    for variable_param_name, fixed_param, variable_param in sweeps:
+        fixed_param_to_str = ''.join([f'{k}={v},' for k, v in fixed_param.items()])
+        metrics_result = OrderedDict({k: [] for k in schedulers.keys()})
+        intervals = OrderedDict({k: [] for k in schedulers.keys()})
+        for _ in variable_param:
+            for scheduler_name, metrics in zip(schedulers.keys(), next(runs)):
+                keys = list(metrics[0].keys())
+                mean, half = mean_interval([[metric[k] for metric in metrics] for k in keys], cfg.exp.confidence)
+                metrics_result[scheduler_name].append(dict(zip(keys, mean.tolist())))
+                intervals[scheduler_name].append(dict(zip(keys, half.tolist())))
+
+        save_path = Path(log_path).joinpath(variable_param_name)
+        save_path.mkdir(exist_ok=True, parents=False)
+        plot(metrics_result, variable_param_name, variable_param, path=save_path / fixed_param_to_str.__add__('.png'),
+             intervals=intervals)
+        if 'schedule_hist_0' in next(iter(metrics_result.values()))[0]:
+            plot_profile(metrics_result, variable_param_name, variable_param,
+                         path=save_path / fixed_param_to_str.__add__('profile.png'))
 
 
 if __name__ == '__main__':
     sys.path.append('./')
-    from src.run.benchmark import benchmark_single
-    from src.schedulers.schedulers import *
-    from src.utils.utils import generate_random_processes
+    from src.run.sweep import cell_seed, run_cells, run_sequential, mean_interval, ResultCache
 
     main()
-
@@ -0,0 +1,143 @@
+import sys
+import json
+import time
+import platform
+import subprocess
+import hydra
+import numpy as np
+
+from hydra.utils import instantiate
+from omegaconf import DictConfig, OmegaConf
+from pathlib import Path
+from typing import *
+
+CONFIG_PATH = str(Path.cwd() / 'config')
+CONFIG_NAME = 'microbench'
+N_WARMUP = 5
+
+
+def make_env(scheduler, queue_len, n_threads, timeline_len, rng):
+    """
+    synthetic `VirtualEnv` with `queue_len` waiting processes that never finish during the benchmark,
+    each with `timeline_len` (run, pause) rounds of history, and the scheduler's own choice of running ones.
+    """
+    env = VirtualEnv(scheduler, n_threads=n_threads)
+    lengths = rng.integers(10 ** 6, 10 ** 7, size=queue_len + n_threads)
+    prios = rng.integers(1, 9, size=queue_len + n_threads)
+    for length, prio in zip(lengths, prios):
+        env.add_new_process(CPU_TIME_NEEDED_TOTAL=int(length), STATIC_PRIO=int(prio))
+
+    # fake history, taken out of and put back into the ready queue like `dispatch` / `preempt` do,
+    # all in the same order so nobody's position changes.
+    for pid, process in env.processes.items():
+        env.ready_queue.remove(pid)
+        for r in range(timeline_len):
+            process.timeline.append((2 * r + 1, PSt.START_RUNNING))
+            process.timeline.run(2 * r + 1)
+            process.timeline.append((2 * r + 2, PSt.PAUSE_RUNNING))
+        process.CPU_TIME_NEEDED -= timeline_len
+        env.ready_queue.requeue(pid, process, move_to_end=True)
+    env.timesteps = 2 * timeline_len + 1
+
+    for _ in range(N_WARMUP):
+        env.tick()
+    return env
+
+
+def time_schedule(scheduler_cfg, queue_len, n_threads, timeline_len, n_calls, seed) -> Dict:
+    scheduler = instantiate(scheduler_cfg)
+    t0 = time.perf_counter()
+    env = make_env(scheduler, queue_len, n_threads, timeline_len, np.random.default_rng(seed))
+    setup_s = time.perf_counter() - t0
+
+    ns = np.zeros(n_calls, dtype=np.int64)
+    for i in range(n_calls):
+        t0 = time.perf_counter_ns()
+        scheduler.schedule(env)
+        ns[i] = time.perf_counter_ns() - t0
+        env._run(n_ticks=1)
+
+    us = ns / 1e3
+    return dict(
+        queue_len=queue_len,
+        n_threads=n_threads,
+        timeline_len=timeline_len,
+        n_calls=n_calls,
+        us_mean=float(us.mean()),
+        us_p50=float(np.percentile(us, 50)),
+        us_p99=float(np.percentile(us, 99)),
+        us_min=float(us.min()),
+        setup_s=setup_s,
+    )
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict], baseline_path, slowdown_alert) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    point = lambda r: (r['scheduler'], r['queue_len'], r['n_threads'], r['timeline_len'])
+    before = {point(r): r for r in baseline['results']}
+    print(f'against {baseline_path} (commit {baseline.get("commit")}), p50 ratio now / before:')
+    for r in results:
+        if point(r) not in before:
+            continue
+        ratio = r['us_p50'] / max(before[point(r)]['us_p50'], 1e-3)
+        flag = '  <-- slower' if ratio >= slowdown_alert else ''
+        print(f'{r["scheduler"]:>8} q={r["queue_len"]:<7} n_threads={r["n_threads"]:<4} '
+              f'timeline={r["timeline_len"]:<4} {ratio:6.2f}x{flag}')
+
+
+@hydra.main(version_base=None, config_path=CONFIG_PATH, config_name=CONFIG_NAME)
+def main(cfg: DictConfig):
+    bench = cfg.bench
+    schedulers = OmegaConf.to_container(cfg.schedulers, resolve=True)
+    base = dict(bench.base)
+    points = []
+    for axis in ('queue_len', 'n_threads', 'timeline_len'):
+        for v in bench[axis]:
+            p = base | {axis: v}
+            if p not in points:
+                points.append(p)
+
+    results = []
+    for name, scheduler_cfg in schedulers.items():
+        scheduler = str(instantiate(scheduler_cfg))
+        for p in points:
+            result = dict(scheduler=scheduler) | time_schedule(
+                scheduler_cfg, n_calls=bench.n_calls, seed=bench.seed, **p)
+            results.append(result)
+            print(f'{scheduler:>8} q={p["queue_len"]:<7} n_threads={p["n_threads"]:<4} timeline={p["timeline_len"]:<4} '
+                  f'p50={result["us_p50"]:10.1f}us  p99={result["us_p99"]:10.1f}us')
+
+    commit = git_commit()
+    save_dir = Path(bench.save_dir)
+    save_dir.mkdir(exist_ok=True, parents=True)
+    path = save_dir / f'{time.strftime("%m%d_%H%M%S")}-{commit or "nogit"}.json'
+    with open(path, 'w') as f:
+        json.dump(dict(
+            commit=commit,
+            python=platform.python_version(),
+            numpy=np.__version__,
+            machine=platform.machine(),
+            config=OmegaConf.to_container(bench, resolve=True),
+            results=results,
+        ), f, indent=1)
+    print(f'saved to {path}')
+
+    if bench.baseline:
+        compare(results, bench.baseline, bench.slowdown_alert)
+
+
+if __name__ == '__main__':
+    sys.path.append('./')
+    from src.run.virtual_env import VirtualEnv
+    from src.process.process import ProcessState as PSt
+
+    main()
@@ -0,0 +1,66 @@
+import sys
+import json
+import hydra
+
+from omegaconf import DictConfig, OmegaConf
+from pathlib import Path
+from typing import *
+
+CONFIG_PATH = str(Path.cwd() / 'config')
+CONFIG_NAME = 'tune'
+N_SHOWN = 5
+
+
+def save_scheduler(name: str, scheduler: Dict, directory: Path) -> Path:
+    """as `config/schedulers/<class name>.yaml`, `name: {_target_: ..., params}`."""
+    path = directory / f'{scheduler["_target_"].rsplit(".", 1)[-1]}.yaml'
+    OmegaConf.save(OmegaConf.create({name: scheduler}), path)
+    return path
+
+
+@hydra.main(version_base=None, config_path=CONFIG_PATH, config_name=CONFIG_NAME)
+def main(cfg: DictConfig):
+    tune = cfg.tune
+    log_path = Path(tune.save_dir).joinpath(tune.uuid)
+    log_path.mkdir(exist_ok=True, parents=True)
+
+    schedulers = OmegaConf.to_container(cfg.schedulers, resolve=True)
+    search_space = OmegaConf.to_container(cfg.search_space, resolve=True)
+    cell = dict(
+        workload=OmegaConf.to_container(tune.workload, resolve=True),
+        virtual_env=OmegaConf.to_container(cfg.virtual_env, resolve=True),
+        corpus=tune.corpus_dir,
+        trace=None,
+    )
+
+    scores = dict()
+    for name, scheduler in schedulers.items():
+        if not search_space.get(name):
+            print(f'{name}: nothing to tune.')
+            continue
+        candidates = sample_candidates(scheduler, search_space[name], tune.n_candidates, seed=tune.seed)
+        ranking = successive_halving(
+            candidates, cell, base_seed=tune.seed, metric=tune.metric, maximize=tune.maximize, eta=tune.eta,
+            min_repeats=tune.min_repeats, max_repeats=tune.max_repeats, n_workers=tune.n_workers, batch_repeats=True)
+        scores[name] = [dict(scheduler=c, score=score, n_repeats=n) for c, score, n in ranking]
+
+        print(f'{name}: {len(candidates)} candidates, {sum(n for _, _, n in ranking)} runs, {tune.metric}:')
+        for c, score, n in ranking[:N_SHOWN]:
+            params = {k: v for k, v in c.items() if k != '_target_'}
+            print(f'  {score:12.2f} on {n:>3} workloads  {params}{"  (current)" if c == scheduler else ""}')
+
+        best = ranking[0][0]
+        print(f'  saved to {save_scheduler(name, best, log_path)}')
+        if tune.write_back:
+            print(f'  written back to {save_scheduler(name, best, Path(CONFIG_PATH) / "schedulers")}')
+
+    with open(log_path / 'scores.json', 'w') as f:
+        json.dump(
+            dict(metric=tune.metric, maximize=tune.maximize, workload=cell['workload'], scores=scores), f, indent=1)
+
+
+if __name__ == '__main__':
+    sys.path.append('./')
+    from src.run.tune import sample_candidates, successive_halving
+
+    main()
@@ -11,6 +11,8 @@ class ProcessState(Enum):
 
 
 class ProcessBase:
+    __slots__ = ('pid', 'CPU_TIME_NEEDED_TOTAL', 'name', 'is_user_task', 'STATIC_PRIO')
+
     def __init__(
         self,
         pid: int,
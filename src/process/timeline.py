@@ -0,0 +1,135 @@
+from array import array
+from typing import *
+from src.process.process import ProcessState as PSt
+
+
+STATES = list(PSt)
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+RUNNING = STATE_CODES[PSt.RUNNING]
+START_RUNNING = STATE_CODES[PSt.START_RUNNING]
+FINISHED = STATE_CODES[PSt.FINISHED]
+
+
+class Timeline:
+    """
+    Run-length encoded timeline of a process: consecutive RUNNING ticks are stored as one run, so memory grows
+    with state changes instead of cpu time. it still reads like the list of (timestep, state) it replaces.
+    """
+    __slots__ = ('data', 'size', 'created_at', 'started_at', 'finished_at', 'run_time')
+
+    def __init__(self):
+        # (first timestep, state code, index in the expanded timeline) of each run, flat in a single buffer.
+        self.data = array('q')
+        self.size = 0
+
+        self.created_at = None
+        self.started_at = None
+        self.finished_at = None
+        self.run_time = 0
+
+    def __copy__(self):
+        # runs are appended in place, a copy can't share them.
+        other = Timeline()
+        other.data = array('q', self.data)
+        other.size, other.run_time = self.size, self.run_time
+        other.created_at, other.started_at, other.finished_at = self.created_at, self.started_at, self.finished_at
+        return other
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for t, state, length in self.runs():
+            for i in range(length):
+                yield t + i, state
+
+    @property
+    def times(self) -> array:
+        return self.data[0::3]
+
+    @property
+    def states(self) -> array:
+        return self.data[1::3]
+
+    @property
+    def offsets(self) -> array:
+        return self.data[2::3]
+
+    def n_runs(self) -> int:
+        return len(self.data) // 3
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError('timeline index out of range')
+        # bisect on the offsets in place, `self.offsets` would copy all of them per access.
+        data = self.data
+        lo, hi = 0, len(data) // 3
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if data[3 * mid + 2] <= index:
+                lo = mid + 1
+            else:
+                hi = mid
+        i = 3 * (lo - 1)
+        return data[i] + index - data[i + 2], STATES[data[i + 1]]
+
+    def __repr__(self):
+        return f'Timeline({list(self.runs())})'
+
+    def runs(self) -> Iterator[Tuple[int, PSt, int]]:
+        """(first timestep, state, n_ticks) of each run."""
+        data = self.data
+        for i in range(0, len(data), 3):
+            end = data[i + 5] if i + 3 < len(data) else self.size
+            yield data[i], STATES[data[i + 1]], end - data[i + 2]
+
+    def append(self, entry: Tuple[int, PSt]):
+        t, state = entry
+        if state is PSt.RUNNING:
+            self.run(t, 1)
+            return
+        if state is PSt.CREATE and self.created_at is None:
+            self.created_at = t
+        elif state is PSt.START_RUNNING and self.started_at is None:
+            self.started_at = t
+        elif state is PSt.FINISHED and self.finished_at is None:
+            self.finished_at = t
+        self._new_run(t, STATE_CODES[state])
+
+    def extend(self, entries: Iterable[Tuple[int, PSt]]):
+        for entry in entries:
+            self.append(entry)
+
+    def run(self, t, n_ticks=1):
+        """append `n_ticks` RUNNING ticks starting at `t`."""
+        if n_ticks <= 0:
+            return
+        self.run_time += n_ticks
+        data = self.data
+        if data and data[-2] == RUNNING and data[-3] + self.size - data[-1] == t:
+            self.size += n_ticks
+        else:
+            self._new_run(t, RUNNING)
+            self.size += n_ticks - 1
+
+    def complete(self, t, n_ticks):
+        """START_RUNNING at `t`, `n_ticks` RUNNING ticks and FINISHED: the rest of a process that is never paused."""
+        size = self.size
+        self.data.extend((t, START_RUNNING, size, t, RUNNING, size + 1, t + n_ticks, FINISHED, size + 1 + n_ticks))
+        self.size = size + 2 + n_ticks
+        self.run_time += n_ticks
+        if self.started_at is None:
+            self.started_at = t
+        if self.finished_at is None:
+            self.finished_at = t + n_ticks
+
+    def timesteps_of(self, state: PSt) -> List[int]:
+        return [t + i for t, s, length in self.runs() if s is state for i in range(length)]
+
+    def _new_run(self, t, code):
+        self.data.extend((t, code, self.size))
+        self.size += 1
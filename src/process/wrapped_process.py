@@ -1,14 +1,45 @@
+import copy
 from src.process.process import ProcessBase
 from src.process.process import ProcessState as PSt
+from src.process.timeline import Timeline
 from typing import *
 
 
 class WrappedProcess:
+    """
+    A process as the env and schedulers see it. per-scheduler properties (e.g. slice_cnt, queue_index) given to
+    the constructor become `__slots__` of a subclass made once per set of names, so no process carries a
+    `__dict__`: less memory and faster attribute access with 10^5+ live processes.
+    """
+    __slots__ = ('task_base', 'CPU_TIME_NEEDED', 'timeline', 'stall')
+    _with_properties = dict()
+
+    def __new__(cls, task: ProcessBase = None, **extra_property):
+        if cls is WrappedProcess and extra_property:
+            cls = cls.with_properties(*extra_property)
+        return super().__new__(cls)
+
+    @classmethod
+    def with_properties(cls, *names) -> Type['WrappedProcess']:
+        """slotted subclass holding `names` besides the base fields."""
+        key = tuple(sorted(names))
+        if key not in cls._with_properties:
+            cls._with_properties[key] = type(f'{cls.__name__}[{", ".join(key)}]', (cls,), dict(__slots__=key))
+        return cls._with_properties[key]
+
+    def __reduce__(self):
+        # the subclasses are made at runtime, pickle by their property names.
+        return _rebuild, (self.task_base, self.properties(), self.CPU_TIME_NEEDED, self.timeline, self.stall)
+
+    def __copy__(self):
+        # task_base never changes and is shared, the timeline is not.
+        return _rebuild(self.task_base, self.properties(), self.CPU_TIME_NEEDED, copy.copy(self.timeline), self.stall)
 
     def __init__(self, task: ProcessBase, **extra_property):
         self.task_base = task
         self.CPU_TIME_NEEDED = task.CPU_TIME_NEEDED_TOTAL
-        self.timeline = list()  # log timeline of this task, e.g. begin, pause, end.
+        self.timeline = Timeline()  # log timeline of this task, e.g. begin, pause, end.
+        self.stall = 0  # ticks of scheduling cost to burn on cpu before making progress, see `CostModel`.
 
         if extra_property is not None:
             self.register_property(**extra_property)
@@ -17,16 +48,19 @@ class WrappedProcess:
         for k, v in extra_property.items():
             setattr(self, k, v)
 
+    def properties(self) -> Dict[str, Any]:
+        """per-scheduler properties and their values."""
+        return {k: getattr(self, k) for k in type(self).__slots__} if type(self) is not WrappedProcess else {}
+
     def get_state_timesteps(self, query_state: PSt) -> List:
-        return list(filter(
-            lambda x: x is not None, [t if state is query_state else None for t, state in self.timeline]))
+        return self.timeline.timesteps_of(query_state)
 
     def compute_metrics(self):
         assert self.timeline[-1][-1] is PSt.FINISHED
-        t_created = self.get_state_timesteps(PSt.CREATE)[0]
-        turnaround_t = self.get_state_timesteps(PSt.FINISHED)[0] - t_created
+        t_created = self.timeline.created_at
+        turnaround_t = self.timeline.finished_at - t_created
         weighted_turnaround_t = turnaround_t / self.task_base.CPU_TIME_NEEDED_TOTAL
-        response_t = self.get_state_timesteps(PSt.START_RUNNING)[0] - t_created
+        response_t = self.timeline.started_at - t_created
         weighted_response_t = response_t / self.task_base.CPU_TIME_NEEDED_TOTAL
 
         return dict(
@@ -34,4 +68,10 @@ class WrappedProcess:
             TAT_Norm=weighted_turnaround_t,
             RT=response_t,
             RT_Norm=weighted_response_t
-        )
\ No newline at end of file
+        )
+
+
+def _rebuild(task, properties, CPU_TIME_NEEDED, timeline, stall) -> WrappedProcess:
+    process = WrappedProcess(task, **properties)
+    process.CPU_TIME_NEEDED, process.timeline, process.stall = CPU_TIME_NEEDED, timeline, stall
+    return process
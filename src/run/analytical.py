@@ -0,0 +1,98 @@
+import heapq
+import numpy as np
+from typing import *
+from src.run.virtual_env import new_process
+from src.schedulers.schedulers import SchedulerBase, HRRF
+
+
+SMALL_QUEUE = 64  # HRRF ranks up to this many waiting processes in python, more with numpy
+
+
+def supports_analytical(scheduler: SchedulerBase) -> bool:
+    return not scheduler.is_preemptive
+
+
+def schedule_non_preemptive(
+        scheduler: SchedulerBase,
+        test_processes,
+        n_threads=2,
+        on_finish: Callable = None,
+) -> int:
+    """
+    Schedule of a non-preemptive scheduler computed without ticking: a dispatched process runs to completion,
+    so only the moments a cpu frees up (heap of per-cpu free times) or a process arrives at an idle cpu need a
+    decision. O(n log n) for `ready_key` orders (FCFS, SJF), HRRF ranks the waiting ones by response ratio at
+    every decision, vectorized.
+    timelines, finish order and schedule_times are exactly those of `VirtualEnv`.
+    :param test_processes: like `benchmark_single`, consumed lazily.
+    :param on_finish: called with every finished process, in the order `VirtualEnv` finishes them.
+    :return: number of processes
+    """
+    assert supports_analytical(scheduler), f'{scheduler} is preemptive, it has to be simulated.'
+    by_ratio = isinstance(scheduler, HRRF)
+    free = [0] * n_threads  # heap of the timesteps cpus become free
+    waiting = []  # heap of (ready_key, pid, process), or processes in pid order for HRRF
+    finishing = []  # heap of (finished_at, dispatch order, process), not reported yet
+    n_dispatched = 0
+
+    def add(pid, t, CPU_TIME_NEEDED_TOTAL, name=None, is_user_task=False, STATIC_PRIO=4, **kwargs):
+        process = new_process(scheduler, pid, t, CPU_TIME_NEEDED_TOTAL, name, is_user_task, STATIC_PRIO)
+        if by_ratio:
+            waiting.append(process)
+        else:
+            # ties go to the earlier arrival, as in `env.processes`.
+            heapq.heappush(waiting, (scheduler.ready_key(process), pid, process))
+
+    def best(t, n) -> List:
+        if not by_ratio:
+            return [heapq.heappop(waiting)[-1] for _ in range(min(n, len(waiting)))]
+        if len(waiting) <= SMALL_QUEUE:
+            picked = heapq.nsmallest(n, range(len(waiting)), key=lambda i: (
+                -(t - waiting[i].timeline.created_at) / waiting[i].CPU_TIME_NEEDED, i))
+            return _pop_in_order(waiting, picked)
+        created = np.fromiter((p.timeline.created_at for p in waiting), dtype=np.int64, count=len(waiting))
+        length = np.fromiter((p.CPU_TIME_NEEDED for p in waiting), dtype=np.int64, count=len(waiting))
+        # highest ratio first, ties to the earlier arrival like `heapq.nlargest` over `env.processes`.
+        return _pop_in_order(waiting, np.argsort(-((t - created) / length), kind='stable')[:n])
+
+    def report(t):
+        while finishing and finishing[0][0] <= t:
+            process = heapq.heappop(finishing)[-1]
+            if on_finish is not None:
+                on_finish(process)
+
+    arrivals = iter(test_processes)
+    next_arrival = next(arrivals, None)
+    n_created = 0
+    while next_arrival is not None or waiting:
+        t = free[0] if waiting else max(free[0], next_arrival[0])
+        while next_arrival is not None and next_arrival[0] <= t:
+            add(n_created, next_arrival[0], **next_arrival[1])
+            n_created += 1
+            next_arrival = next(arrivals, None)
+        report(t)
+
+        idle = []
+        while free and free[0] <= t:
+            idle.append(heapq.heappop(free))
+        for process in best(t, len(idle)):
+            idle.pop()
+            length = process.CPU_TIME_NEEDED
+            process.timeline.complete(t, length)
+            process.CPU_TIME_NEEDED = 0
+            heapq.heappush(free, t + length)
+            heapq.heappush(finishing, (t + length, n_dispatched, process))
+            n_dispatched += 1
+            scheduler.schedule_times += 1
+        for _ in idle:
+            heapq.heappush(free, t)
+    report(float('inf'))
+    return n_created
+
+
+def _pop_in_order(processes: List, picked) -> List:
+    # take out processes[i] for i in picked, returned in the order of picked.
+    result = [processes[i] for i in picked]
+    for i in sorted(picked, reverse=True):
+        processes.pop(i)
+    return result
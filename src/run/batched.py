@@ -0,0 +1,162 @@
+import numpy as np
+from typing import *
+from src.run.benchmark import summarize
+from src.schedulers.schedulers import SchedulerBase, FCFS, SJF, RR, SP
+from src.utils.workload import Workload
+
+
+NEVER = np.iinfo(np.int64).max
+KEY_SHIFT = 32  # composite ready keys: primary key << KEY_SHIFT | position in `env.processes`
+
+
+def supports_batched(scheduler: SchedulerBase) -> bool:
+    # exact types, a subclass may schedule differently.
+    return type(scheduler) in (FCFS, RR, SP) or (type(scheduler) is SJF and not scheduler.is_preemptive)
+
+
+def benchmark_batched(scheduler: SchedulerBase, workloads: List, n_threads=2) -> List[Dict]:
+    """
+    Simulate R workloads (each a `Workload` or like `test_processes` of `benchmark_single`) in lockstep.
+    waiting processes live in (R, N) arrays, the running ones in (R, n_threads) slots, and all replicas jump
+    together over ticks where none of them has anything to decide. only the simple policies are supported, see
+    `supports_batched`; they schedule exactly like their VirtualEnv versions, so metrics match `benchmark_single`
+    up to float rounding.
+    :return: metrics of each workload, same keys as `evaluate`
+    """
+    assert supports_batched(scheduler), f'{scheduler} is not supported by the batched engine.'
+    n_replicas, n_max = len(workloads), max(len(w) for w in workloads)
+    rows = np.arange(n_replicas)
+    uses_slices = isinstance(scheduler, (RR, SP))
+
+    n_arrivals = np.array([len(w) for w in workloads], dtype=np.int64)
+    arrival = np.full((n_replicas, n_max + 1), NEVER, dtype=np.int64)  # one extra column as sentinel
+    length = np.ones((n_replicas, n_max), dtype=np.int64)
+    prio = np.zeros((n_replicas, n_max), dtype=np.int64)
+    for r, workload in enumerate(workloads):
+        if not isinstance(workload, Workload):
+            workload = Workload.from_processes(workload)
+        arrival[r, :len(workload)] = workload.arrival
+        length[r, :len(workload)] = workload.length
+        prio[r, :len(workload)] = workload.prio
+    max_prio = int(prio.max(initial=0))
+
+    # waiting processes, key is NEVER for everything else.
+    key = np.full((n_replicas, n_max), NEVER, dtype=np.int64)
+    remaining = length.copy()
+    n_waiting = np.zeros(n_replicas, dtype=np.int64)
+    next_arrival = np.zeros(n_replicas, dtype=np.int64)  # index of the next process to arrive
+    next_seq = np.zeros(n_replicas, dtype=np.int64)
+    # running processes, slot order is not `env.on_running` order, `slot_order` is.
+    slot_pid = np.full((n_replicas, n_threads), -1, dtype=np.int64)
+    slot_remaining = np.zeros((n_replicas, n_threads), dtype=np.int64)
+    slot_cnt = np.zeros((n_replicas, n_threads), dtype=np.int64)
+    slot_order = np.zeros((n_replicas, n_threads), dtype=np.int64)
+    next_order = 0
+
+    started = np.full((n_replicas, n_max), -1, dtype=np.int64)
+    finished = np.full((n_replicas, n_max), -1, dtype=np.int64)
+    finished[np.arange(n_max) >= n_arrivals[:, None]] = 0  # padding
+    schedule_times = np.zeros(n_replicas, dtype=np.int64)
+
+    def ready_key(r, i):
+        # same order as the scheduler's `ready_key`, ties broken by position in `env.processes`.
+        seq = next_seq[r]
+        next_seq[r] += 1
+        if isinstance(scheduler, FCFS):
+            return i
+        if isinstance(scheduler, SJF):
+            return (remaining[r, i] << KEY_SHIFT) | seq
+        if isinstance(scheduler, SP):
+            return ((max_prio - prio[r, i]) << KEY_SHIFT) | seq
+        return seq
+
+    t, lo = 0, 0
+    while True:
+        occupied = slot_pid >= 0
+        if not occupied.any() and not n_waiting.any() and (next_arrival >= n_arrivals).all():
+            break
+
+        # jump over ticks in which no replica has anything to decide.
+        if not ((~occupied).any(axis=1) & (n_waiting > 0)).any():
+            horizon = arrival[rows, next_arrival].min()
+            if occupied.any():
+                horizon = min(horizon, t + slot_remaining[occupied].min())
+                if uses_slices and (slot_cnt[occupied] >= 0).any():
+                    horizon = min(horizon, t + slot_cnt[occupied & (slot_cnt >= 0)].min())
+            n_ticks = int(horizon - t)
+            if n_ticks > 0:
+                slot_remaining[occupied] -= n_ticks
+                slot_cnt[occupied] -= n_ticks
+                t += n_ticks
+                _finish(occupied & (slot_remaining <= 0), slot_pid, finished, t)
+                continue
+
+        # arrivals
+        while True:
+            arrived = arrival[rows, next_arrival] == t
+            if not arrived.any():
+                break
+            r = rows[arrived]
+            i = next_arrival[r]
+            key[r, i] = ready_key(r, i)
+            n_waiting[r] += 1
+            next_arrival[r] += 1
+
+        # pause expired processes, requeued behind all others in `env.on_running` order.
+        if uses_slices:
+            expired = occupied & (slot_cnt == 0)
+            while expired.any():
+                has = expired.any(axis=1)
+                r = rows[has]
+                s = np.where(expired, slot_order, NEVER).argmin(axis=1)[has]
+                i = slot_pid[r, s]
+                remaining[r, i] = slot_remaining[r, s]
+                key[r, i] = ready_key(r, i)
+                n_waiting[r] += 1
+                slot_pid[r, s] = -1
+                expired[r, s] = False
+
+        # dispatch the best waiting processes into free slots.
+        hi = int(next_arrival.max())
+        for _ in range(n_threads):
+            need = (slot_pid < 0).any(axis=1) & (n_waiting > 0)
+            if not need.any():
+                break
+            r = rows[need]
+            i = lo + key[r, lo:hi].argmin(axis=1)
+            s = (slot_pid[r] < 0).argmax(axis=1)
+            slot_pid[r, s] = i
+            slot_remaining[r, s] = remaining[r, i]
+            slot_order[r, s] = next_order
+            next_order += 1
+            if isinstance(scheduler, RR):
+                slot_cnt[r, s] = scheduler.time_slice
+            elif isinstance(scheduler, SP):
+                slot_cnt[r, s] = scheduler.min_time_slice + prio[r, i] * scheduler.time_slice_increment
+            started[r, i] = np.where(started[r, i] < 0, t, started[r, i])
+            key[r, i] = NEVER
+            n_waiting[r] -= 1
+            schedule_times[r] += 1
+
+        # run one tick
+        occupied = slot_pid >= 0
+        slot_cnt[occupied] -= 1
+        slot_remaining[occupied] -= 1
+        t += 1
+        _finish(occupied & (slot_remaining <= 0), slot_pid, finished, t)
+        while lo < hi and (finished[:, lo] >= 0).all():
+            lo += 1
+
+    metrics = []
+    for r, n in enumerate(n_arrivals):
+        metric = summarize(
+            arrival[r, :n], started[r, :n], finished[r, :n], length[r, :n], prio[r, :n], n_threads=n_threads)
+        metric['schedule_times'] = int(schedule_times[r])
+        metrics.append(metric)
+    return metrics
+
+
+def _finish(done, slot_pid, finished, t):
+    r, s = np.nonzero(done)
+    finished[r, slot_pid[r, s]] = t
+    slot_pid[r, s] = -1
@@ -1,49 +1,339 @@
-from src.run.virtual_env import VirtualEnv
+import copy
+import math
+import heapq
+import itertools
+import numpy as np
+from collections import OrderedDict
+from typing import *
+from src.run.virtual_env import VirtualEnv, EventDrivenEnv, MultiCoreEnv, CostModel, fork
+from src.run.profiler import TickProfiler
+from src.run.telemetry import Telemetry
+from src.run.analytical import schedule_non_preemptive, supports_analytical
 from src.schedulers.schedulers import SchedulerBase
 
 
-def evaluate(processes_done, scheduler, verbose=True):
+PERCENTILES = (50, 90, 99)
+
+
+def weighted_percentile(values, weights, q) -> np.ndarray:
+    """smallest values such that at least q% of the total weight sits at or below them."""
+    order = np.argsort(values, kind='stable')
+    cdf = np.cumsum(weights[order])
+    index = np.searchsorted(cdf, np.asarray(q) / 100 * cdf[-1], side='left')
+    return values[order][np.minimum(index, len(values) - 1)]
+
+
+def summarize(created, started, finished, cpu_time, prio, n_threads=None) -> Dict:
     """
-    return following metrics:
-    1. turnround_time: regular, normalized, prio-weighted
-    2. response_time: regular, normalized, prio-weighted
+    metrics from per-process columns: created, first started and finished timestep, total cpu time needed
+    and static priority, in one vectorized pass. shared by `evaluate` and the batched engine.
+    1. mean and prio-weighted mean of TAT, RT and their normalized versions (`TAT`, `prio_TAT`, ...)
+    2. p50/p90/p99/max of them, prio-weighted ones count each process STATIC_PRIO times (`TAT_p99`, `prio_TAT_p99`)
+    3. throughput (processes per timestep) and cpu utilization over the makespan, the latter needs n_threads.
+    raises ValueError without any process, none of these are defined then.
     """
+    created, started, finished, cpu_time, prio = (
+        np.asarray(column, dtype=np.float64) for column in (created, started, finished, cpu_time, prio))
+    if not len(finished):
+        raise ValueError('no finished processes')
+    turnaround_t = finished - created
+    response_t = started - created
+    samples = dict(
+        TAT=turnaround_t,
+        TAT_Norm=turnaround_t / cpu_time,
+        RT=response_t,
+        RT_Norm=response_t / cpu_time,
+    )
+
     metrics = dict()
-    sum_prio = sum([task.task_base.STATIC_PRIO for _, task in processes_done.items()])
-    num_processes = len(processes_done)
-    for pid, processes in processes_done.items():
-        for k, v in processes.compute_metrics().items():
-            if k in metrics.keys():
-                metrics[k].append(v / num_processes)
-                metrics['prio_' + k].append(v * processes.task_base.STATIC_PRIO / sum_prio)
-            else:
-                metrics[k] = [v / num_processes]
-                metrics['prio_' + k] = [v * processes.task_base.STATIC_PRIO / sum_prio]
-
-    for k, v in metrics.items():
-        metrics[k] = sum(v)
-        if verbose:
-            print(f'{k}: {sum(v):.2f}')
+    for k, v in samples.items():
+        metrics[k] = float(v.mean())
+        metrics['prio_' + k] = float((v * prio).sum() / prio.sum())
+
+    for k, v in samples.items():
+        for prefix, weights in (('', np.ones_like(prio)), ('prio_', prio)):
+            for q, value in zip(PERCENTILES, weighted_percentile(v, weights, PERCENTILES)):
+                metrics[f'{prefix}{k}_p{q}'] = float(value)
+            metrics[f'{prefix}{k}_max'] = float(v.max())
+
+    makespan = finished.max() - created.min()
+    metrics['throughput'] = float(len(finished) / makespan)
+    if n_threads is not None:
+        metrics['cpu_utilization'] = float(cpu_time.sum() / (makespan * n_threads))
+    return metrics
+
+
+def evaluate(processes_done, scheduler, verbose=True, n_threads=None, profiler: TickProfiler = None):
+    """
+    return following metrics, see `summarize`:
+    1. turnround_time: regular, normalized, prio-weighted, mean and tail
+    2. response_time: regular, normalized, prio-weighted, mean and tail
+    3. throughput, cpu utilization (if n_threads is given) and schedule times
+    4. wall time of `schedule` and `tick` calls in microseconds (if profiled, see `TickProfiler.summary`)
+    """
+    columns = np.array([
+        (p.timeline.created_at, p.timeline.started_at, p.timeline.finished_at,
+         p.task_base.CPU_TIME_NEEDED_TOTAL, p.task_base.STATIC_PRIO) for p in processes_done.values()
+    ], dtype=np.float64).reshape(-1, 5)
+    metrics = summarize(*columns.T, n_threads=n_threads)
+    return report(metrics, scheduler, verbose=verbose, profiler=profiler)
+
+
+def report(metrics, scheduler, verbose=True, profiler: TickProfiler = None):
+    if profiler is not None:
+        metrics.update(profiler.summary(PERCENTILES))
+    if verbose:
+        for k, v in metrics.items():
+            print(f'{k}: {v:.2f}')
 
     metrics['schedule_times'] = scheduler.schedule_times
     if verbose:
         print(f'schedule_times: {scheduler.schedule_times}')
+    if profiler is not None:
+        # too many to print, they end up in the sweep results and `plot_profile` of scripts/evaluate.py.
+        metrics.update(profiler.breakdown())
     return metrics
 
 
-def benchmark_single(scheduler: SchedulerBase, test_processes, n_threads=2, verbose=True):
-    env = VirtualEnv(scheduler, n_threads=n_threads)
+class StreamingMetrics:
+    """
+    Folds finished processes into running sums and histograms instead of keeping them, same keys as `summarize`.
+    means, max, throughput and utilization are exact, so are percentiles of TAT / RT (integer bins).
+    percentiles of the normalized ones come from log-spaced bins and are within `rel_error`.
+    """
+
+    def __init__(self, n_threads=None, rel_error=0.005):
+        self.n_threads = n_threads
+        self.log_base = math.log1p(2 * rel_error)
+        self.count = 0
+        self.sum_prio = 0.0
+        self.sum_cpu_time = 0.0
+        self.first_created = math.inf
+        self.last_finished = -math.inf
+        self.sums = dict()  # name -> [sum, prio-weighted sum, max]
+        self.histograms = dict()  # name -> {bin: [count, prio-weighted count]}
+
+    def add(self, process):
+        created, started, finished = (
+            process.timeline.created_at, process.timeline.started_at, process.timeline.finished_at)
+        cpu_time, prio = process.task_base.CPU_TIME_NEEDED_TOTAL, float(process.task_base.STATIC_PRIO)
+        self.count += 1
+        self.sum_prio += prio
+        self.sum_cpu_time += cpu_time
+        self.first_created = min(self.first_created, created)
+        self.last_finished = max(self.last_finished, finished)
+
+        turnaround_t, response_t = finished - created, started - created
+        for k, v, exact in (
+            ('TAT', turnaround_t, True),
+            ('TAT_Norm', turnaround_t / cpu_time, False),
+            ('RT', response_t, True),
+            ('RT_Norm', response_t / cpu_time, False),
+        ):
+            sums = self.sums.setdefault(k, [0.0, 0.0, -math.inf])
+            sums[0] += v
+            sums[1] += v * prio
+            sums[2] = max(sums[2], v)
+            b = v if exact or v <= 0 else math.floor(math.log(v) / self.log_base)
+            counts = self.histograms.setdefault(k, dict()).setdefault((exact or v <= 0, b), [0.0, 0.0])
+            counts[0] += 1
+            counts[1] += prio
+
+    def _bin_value(self, b):
+        exact, v = b
+        return v if exact else math.exp((v + 0.5) * self.log_base)
 
-    index = 0
-    while True:
-        while index < len(test_processes) and test_processes[index][0] == env.timesteps:
-            env.add_new_process(**test_processes[index][1])
-            index += 1
-        if env.timesteps > test_processes[-1][0] and env.processes == {}:
-            break
+    def result(self) -> Dict:
+        """same metrics as `summarize`, which raises the same ValueError without any finished process."""
+        if not self.count:
+            raise ValueError('no finished processes')
+        metrics = dict()
+        for k, (total, prio_total, _) in self.sums.items():
+            metrics[k] = total / self.count
+            metrics['prio_' + k] = prio_total / self.sum_prio
 
-        env.tick()
+        for k, histogram in self.histograms.items():
+            bins = sorted(histogram.keys(), key=self._bin_value)
+            values = np.array([self._bin_value(b) for b in bins])
+            counts = np.array([histogram[b] for b in bins])
+            for prefix, weights in (('', counts[:, 0]), ('prio_', counts[:, 1])):
+                cdf = np.cumsum(weights)
+                index = np.searchsorted(cdf, np.asarray(PERCENTILES) / 100 * cdf[-1], side='left')
+                for q, value in zip(PERCENTILES, values[np.minimum(index, len(values) - 1)]):
+                    metrics[f'{prefix}{k}_p{q}'] = float(value)
+                metrics[f'{prefix}{k}_max'] = float(self.sums[k][2])
+
+        makespan = self.last_finished - self.first_created
+        metrics['throughput'] = self.count / makespan
+        if self.n_threads is not None:
+            metrics['cpu_utilization'] = self.sum_cpu_time / (makespan * self.n_threads)
+        return metrics
+
+
+ENGINES = {
+    'tick': VirtualEnv,
+    'event': EventDrivenEnv,
+}
+
+
+class BenchmarkRun:
+    """
+    `benchmark_single` step by step: it can stop at any timestep, be snapshotted and forked there into what-if
+    continuations (other scheduler parameters, an injected burst, more n_threads) sharing the warm-up.
+    """
+
+    def __init__(
+            self,
+            scheduler: SchedulerBase,
+            test_processes,
+            n_threads=2,
+            engine='tick',
+            streaming=False,
+            profile=False,
+            per_core: Dict = None,
+            cost: Dict = None,
+            telemetry: Dict = None,
+    ):
+        """see `benchmark_single`"""
+        self.n_threads = n_threads
+        self.streaming = streaming
+        self.per_core = per_core
+        self.cost = cost
+        self.accumulator = StreamingMetrics(n_threads=n_threads) if streaming else None
+        self.profiler = TickProfiler() if profile else None
+        self.telemetry = Telemetry(**telemetry) if telemetry is not None else None
+        on_finish = self.accumulator.add if streaming else None
+        cost_model = CostModel(**cost) if cost is not None else None
+        if per_core is not None:
+            assert telemetry is None, 'telemetry samples a single run queue, it is not available with per_core.'
+            self.env = MultiCoreEnv(
+                scheduler, n_threads=n_threads, on_finish=on_finish, profiler=self.profiler, cost=cost_model,
+                **per_core)
+        else:
+            self.env = ENGINES[engine](
+                scheduler, n_threads=n_threads, on_finish=on_finish, profiler=self.profiler, cost=cost_model,
+                telemetry=self.telemetry)
+        self.arrivals = iter(test_processes)
+        self.next_arrival = next(self.arrivals, None)
+
+    @property
+    def scheduler(self) -> SchedulerBase:
+        return self.env.scheduler
+
+    @property
+    def done(self) -> bool:
+        return self.next_arrival is None and not self.env.processes
+
+    def run(self, until=math.inf) -> bool:
+        """advance to timestep `until`, or until every process is done. :return: whether every process is done"""
+        env = self.env
+        while env.timesteps < until:
+            while self.next_arrival is not None and self.next_arrival[0] <= env.timesteps:
+                env.add_new_process(**self.next_arrival[1])
+                self.next_arrival = next(self.arrivals, None)
+            if self.done:
+                break
+
+            env.advance(horizon=min(self.next_arrival[0] if self.next_arrival is not None else math.inf, until))
+        return self.done
+
+    def inject(self, processes):
+        """
+        add arrivals, e.g. a burst, to the rest of the workload.
+        :param processes: (arrival timestep, process kwargs), not earlier than now. they go ahead of workload
+            arrivals of the same timestep.
+        """
+        pending = itertools.chain([self.next_arrival] if self.next_arrival is not None else [], self.arrivals)
+        self.arrivals = heapq.merge(sorted(processes, key=lambda a: a[0]), pending, key=lambda a: a[0])
+        self.next_arrival = next(self.arrivals, None)
+
+    def fork(self) -> 'BenchmarkRun':
+        """
+        an independent continuation from here, sharing unchanged process state with this run (see `fork`).
+        change `twin.scheduler`'s parameters, `inject` arrivals or set `twin.env.n_threads` (single queue envs)
+        before running it.
+        """
+        twin = copy.copy(self)
+        self.arrivals, twin.arrivals = itertools.tee(self.arrivals)
+        twin.env, twin.accumulator, twin.profiler, twin.telemetry = fork(
+            self.env, self.accumulator, self.profiler, self.telemetry)
+        return twin
+
+    def snapshot(self) -> 'BenchmarkRun':
+        """frozen copy of this point, `fork` it to start from here as often as needed."""
+        snapshot = copy.copy(self)
+        self.arrivals, snapshot.arrivals = itertools.tee(self.arrivals)
+        snapshot.env, snapshot.accumulator, snapshot.profiler, snapshot.telemetry = copy.deepcopy(
+            (self.env, self.accumulator, self.profiler, self.telemetry))
+        return snapshot
+
+    def result(self, verbose=True) -> Tuple[Dict, Dict]:
+        """processes_done and metrics, like `benchmark_single`."""
+        env, scheduler = self.env, self.scheduler
+        if self.telemetry is not None:
+            self.telemetry.flush()
+        print(f'Scheduler:{scheduler}, {env.n_created} jobs have done.')
+        if self.streaming:
+            metrics = report(self.accumulator.result(), scheduler, verbose=verbose, profiler=self.profiler)
+        else:
+            metrics = evaluate(
+                processes_done=env.processes_done,
+                scheduler=scheduler,
+                verbose=verbose,
+                n_threads=self.n_threads,
+                profiler=self.profiler,
+            )
+        if self.per_core is not None:
+            metrics.update(env.stats())
+        if self.cost is not None:
+            metrics['overhead_ticks'] = env.overhead_ticks
+        return env.processes_done, metrics
+
+
+def benchmark_single(
+        scheduler: SchedulerBase,
+        test_processes,
+        n_threads=2,
+        verbose=True,
+        engine='tick',
+        streaming=False,
+        profile=False,
+        per_core: Dict = None,
+        cost: Dict = None,
+        telemetry: Dict = None,
+        fast_path=True,
+):
+    """
+    :param test_processes: (arrival timestep, process kwargs) sorted by arrival, any iterable (list, Workload,
+        generator, ...). it is consumed lazily.
+    :param streaming: fold finished processes into `StreamingMetrics` and drop them, memory stays bounded by
+        the live processes. the returned processes_done is empty then.
+    :param profile: time every `schedule` call with a `TickProfiler` and report it with the metrics.
+    :param per_core: kwargs of `MultiCoreEnv`, e.g. dict(balance_interval=64), to give each of the n_threads cpus
+        its own run queue instead of sharing one. adds migrations, steals and per-core utilization to the metrics.
+        `engine` doesn't apply, cores are always event-driven.
+    :param cost: kwargs of `CostModel`, e.g. dict(context_switch=1), to charge dispatches with virtual cpu time.
+        adds the burnt `overhead_ticks` to the metrics.
+    :param telemetry: kwargs of `Telemetry`, e.g. dict(stride=16, path='telemetry.bin'), to write queue length,
+        running set, idle cpus and dispatches over time to `path`. not available with per_core.
+    :param fast_path: compute the schedule of non-preemptive schedulers (FCFS, SJF, HRRF) directly instead of
+        simulating it, see `schedule_non_preemptive`. same results, not used with profile / per_core / cost /
+        telemetry.
+    """
+    if fast_path and supports_analytical(scheduler) and not profile and all(
+            option is None for option in (per_core, cost, telemetry)):
+        accumulator = StreamingMetrics(n_threads=n_threads) if streaming else None
+        processes_done = OrderedDict()
+        n_created = schedule_non_preemptive(
+            scheduler, test_processes, n_threads=n_threads,
+            on_finish=accumulator.add if streaming else lambda p: processes_done.__setitem__(p.task_base.pid, p))
+        print(f'Scheduler:{scheduler}, {n_created} jobs have done.')
+        if streaming:
+            return processes_done, report(accumulator.result(), scheduler, verbose=verbose)
+        return processes_done, evaluate(processes_done, scheduler, verbose=verbose, n_threads=n_threads)
 
-    print(f'Scheduler:{scheduler}, {len(env.processes_done)} jobs have done.')
-    metrics = evaluate(processes_done=env.processes_done, scheduler=scheduler, verbose=verbose)
-    return env.processes_done, metrics
\ No newline at end of file
+    run = BenchmarkRun(
+        scheduler, test_processes, n_threads=n_threads, engine=engine, streaming=streaming, profile=profile,
+        per_core=per_core, cost=cost, telemetry=telemetry)
+    run.run()
+    return run.result(verbose=verbose)
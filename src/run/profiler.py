@@ -0,0 +1,85 @@
+import math
+import time
+import numpy as np
+from array import array
+from typing import *
+
+
+class TickProfiler:
+    """
+    Wall-clock cost of every real `VirtualEnv.tick`: time spent in `scheduler.schedule`, time of the whole tick
+    and the ready queue length the scheduler faced, kept in compact arrays (24 bytes per tick).
+    ticks jumped over by the event engine never call `schedule` and are not recorded.
+    """
+
+    def __init__(self):
+        self.schedule_ns = array('q')
+        self.tick_ns = array('q')
+        self.queue_len = array('q')
+
+    def tick(self, env):
+        queue_len = len(env.ready_queue)
+        t0 = time.perf_counter_ns()
+        env.scheduler.schedule(env)
+        t1 = time.perf_counter_ns()
+        env._run(n_ticks=1)
+        t2 = time.perf_counter_ns()
+        self.schedule_ns.append(t1 - t0)
+        self.tick_ns.append(t2 - t0)
+        self.queue_len.append(queue_len)
+
+    def __len__(self):
+        return len(self.schedule_ns)
+
+    def summary(self, percentiles=(50, 90, 99)) -> Dict:
+        """mean / percentiles / max of schedule and tick wall time in microseconds, and the mean queue length."""
+        metrics = dict()
+        for k, ns in (('schedule_us', self.schedule_ns), ('tick_us', self.tick_ns)):
+            us = np.frombuffer(ns, dtype=np.int64) / 1e3 if len(ns) else np.zeros(1)
+            metrics[f'{k}_mean'] = float(us.mean())
+            for q, value in zip(percentiles, np.percentile(us, percentiles, method='inverted_cdf')):
+                metrics[f'{k}_p{q}'] = float(value)
+            metrics[f'{k}_max'] = float(us.max())
+        metrics['ready_queue_len_mean'] = float(np.mean(self.queue_len)) if len(self) else 0.
+        return metrics
+
+    def histogram(self, n_bins=32) -> Tuple[np.ndarray, np.ndarray]:
+        """counts of `schedule` calls per log2-spaced wall time bin, and the bin edges in nanoseconds."""
+        edges = np.logspace(0, n_bins, n_bins + 1, base=2)
+        counts, _ = np.histogram(np.frombuffer(self.schedule_ns, dtype=np.int64), bins=edges)
+        return counts, edges
+
+    def by_queue_len(self) -> Dict[int, Tuple[int, float]]:
+        """
+        cost of a decision as the run queue grows: ready queue lengths grouped by power of two,
+        lower bound -> (number of calls, mean `schedule` wall time in microseconds).
+        """
+        ns = np.frombuffer(self.schedule_ns, dtype=np.int64)
+        queue_len = np.frombuffer(self.queue_len, dtype=np.int64)
+        group = np.where(queue_len > 0, np.floor(np.log2(np.maximum(queue_len, 1))) + 1, 0).astype(np.int64)
+        result = dict()
+        for g in np.unique(group):
+            mask = group == g
+            result[0 if g == 0 else 1 << int(g - 1)] = (int(mask.sum()), float(ns[mask].mean() / 1e3))
+        return result
+
+    def breakdown(self, n_bins=24, max_queue_log2=16) -> Dict:
+        """
+        `histogram` and `by_queue_len` as flat metrics with the same keys for every run, so repeats can be averaged
+        and plotted: `schedule_hist_{i}` share of `schedule` calls that took [2^i, 2^(i+1)) ns, `schedule_us_qlen_{l}`
+        mean wall time of those facing a ready queue of l up to 2l - 1 processes (l = 0, 1, 2, 4, ...,
+        2^max_queue_log2, the last one open-ended), nan where none did.
+        """
+        ns = np.frombuffer(self.schedule_ns, dtype=np.int64)
+        queue_len = np.frombuffer(self.queue_len, dtype=np.int64)
+        metrics = dict()
+        counts = np.bincount(np.clip(np.log2(np.maximum(ns, 1)).astype(np.int64), 0, n_bins - 1), minlength=n_bins)
+        for i, count in enumerate(counts):
+            metrics[f'schedule_hist_{i}'] = float(count / max(len(ns), 1))
+        group = np.where(queue_len > 0, np.floor(np.log2(np.maximum(queue_len, 1))) + 1, 0).astype(np.int64)
+        group = np.minimum(group, max_queue_log2 + 1)
+        for g in range(max_queue_log2 + 2):
+            mask = group == g
+            metrics[f'schedule_us_qlen_{0 if g == 0 else 1 << (g - 1)}'] = (
+                float(ns[mask].mean() / 1e3) if mask.any() else math.nan)
+        return metrics
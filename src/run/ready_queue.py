@@ -0,0 +1,384 @@
+import heapq
+from collections import deque
+from typing import *
+
+
+class AddressableHeap:
+    """
+    Min-heap of (key, item) on C `heapq` whose items can be addressed after being pushed. remove only forgets the
+    item, its stale entry is dropped once it reaches the top, or all of them once they outnumber the live ones.
+    push and pop-min are O(log n), remove and peek O(1) amortized.
+    """
+
+    def __init__(self):
+        self.heap = []  # (key, item), stale ones included
+        self.entry_of = dict()  # item -> its live entry
+
+    def __len__(self):
+        return len(self.entry_of)
+
+    def __contains__(self, item):
+        return item in self.entry_of
+
+    def __iter__(self):
+        # push order, not sorted order.
+        return iter(self.entry_of)
+
+    def key(self, item):
+        return self.entry_of[item][0]
+
+    def peek(self):
+        return self._top()[1]
+
+    def push(self, item, key):
+        assert item not in self.entry_of, f'{item} is already in heap.'
+        entry = (key, item)
+        self.entry_of[item] = entry
+        heapq.heappush(self.heap, entry)
+
+    def pop(self):
+        key, item = self._top()
+        heapq.heappop(self.heap)
+        del self.entry_of[item]
+        return item, key
+
+    def remove(self, item):
+        del self.entry_of[item]
+        if len(self.heap) > 2 * len(self.entry_of) + 16:
+            self.heap = [e for e in self.heap if self.entry_of.get(e[1]) is e]
+            heapq.heapify(self.heap)
+
+    def nsmallest(self, n) -> List[Tuple]:
+        """n smallest (key, item) in order, O(n log n) plus the stale entries above them."""
+        if not self.entry_of:
+            return []
+        heap, entry_of = self.heap, self.entry_of
+        top = self._top()
+        if n == 1:
+            return [top]
+        result = []
+        frontier = [(top, 0)]
+        while frontier and len(result) < n:
+            entry, i = heapq.heappop(frontier)
+            if entry_of.get(entry[1]) is entry:
+                result.append(entry)
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+        return result
+
+    def _top(self) -> Tuple:
+        heap, entry_of = self.heap, self.entry_of
+        while entry_of.get(heap[0][1]) is not heap[0]:
+            heapq.heappop(heap)
+        return heap[0]
+
+
+class ReadyQueue:
+    """
+    Processes of a VirtualEnv that wait for a cpu, ordered by `key(process)` and then by their position in
+    `env.processes` (arrival, or the last `move_to_end`), i.e. the same order as a stable sort of `env.processes`.
+    the key must not change while a process is waiting.
+    """
+
+    def __init__(self, key: Callable = None):
+        self.key = key if key else (lambda process: ())
+        self.heap = AddressableHeap()
+        self.seq = dict()  # pid -> position in env.processes, kept for running processes too.
+        self.next_seq = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, pid):
+        return pid in self.heap
+
+    def __iter__(self):
+        return iter(self.heap)
+
+    def sort_key(self, pid, process):
+        return self.key(process) + (self.seq[pid],)
+
+    def peek(self):
+        return self.heap.peek()
+
+    def peek_key(self) -> Tuple:
+        """a lower bound of the sort keys of waiting processes (here: exactly the smallest one)."""
+        return self.heap.key(self.heap.peek())
+
+    def add(self, pid, process):
+        self.seq[pid] = self.next_seq
+        self.next_seq += 1
+        self.heap.push(pid, self.sort_key(pid, process))
+
+    def requeue(self, pid, process, move_to_end=False):
+        if move_to_end:
+            self.seq[pid] = self.next_seq
+            self.next_seq += 1
+        self.heap.push(pid, self.sort_key(pid, process))
+
+    def remove(self, pid):
+        self.heap.remove(pid)
+
+    def discard(self, pid):
+        self.seq.pop(pid)
+
+    def detach(self, pid, process):
+        """take a waiting process out for good, e.g. to migrate it: `remove` and `discard`."""
+        self.remove(pid)
+        self.discard(pid)
+
+    def head(self, n, env) -> List[int]:
+        """first n pids of running + waiting processes, same as `sorted(env.processes, key)[:n]`."""
+        waiting = self.heap.nsmallest(n)
+        if not env.on_running:
+            return [pid for _, pid in waiting]
+        # only the few running ones are out of order, sorting them in beats another `nsmallest`.
+        candidates = [(self.sort_key(pid, env.processes[pid]), pid) for pid in env.on_running] + waiting
+        candidates.sort()
+        return [pid for _, pid in candidates[:n]]
+
+
+class MultiLevelQueue(ReadyQueue):
+    """
+    Waiting processes in one FIFO deque per level (a non-negative int, lower first) plus a bitmap of non-empty
+    levels, like the classic O(1) scheduler: enqueue and pick-next are O(1), removal is O(1) amortized (entries
+    are dropped lazily when they reach the front). same order as `ReadyQueue(key=lambda p: (level(p),))`.
+    """
+
+    def __init__(self, level: Callable):
+        super().__init__(key=lambda process: (level(process),))
+        self.level = level
+        self.levels = dict()  # level -> deque of (seq, pid), stale ones are skipped
+        self.entry_of = dict()  # pid -> its live entry
+        self.level_of = dict()
+        self.counts = dict()  # level -> number of live entries
+        self.bitmap = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, pid):
+        return pid in self.entry_of
+
+    def __iter__(self):
+        return iter(self.entry_of)
+
+    def peek(self):
+        return self._front(self._lowest_level())[1]
+
+    def peek_key(self) -> Tuple:
+        level = self._lowest_level()
+        return level, self._front(level)[0]
+
+    def add(self, pid, process):
+        self.seq[pid] = self.next_seq
+        self.next_seq += 1
+        self._push(pid, process)
+
+    def requeue(self, pid, process, move_to_end=False):
+        if move_to_end:
+            self.seq[pid] = self.next_seq
+            self.next_seq += 1
+        self._push(pid, process)
+
+    def remove(self, pid):
+        self.entry_of.pop(pid)
+        level = self.level_of.pop(pid)
+        self.size -= 1
+        self.counts[level] -= 1
+        if not self.counts[level]:
+            self.bitmap &= ~(1 << level)
+            self.levels[level].clear()
+        elif len(self.levels[level]) > 2 * self.counts[level]:
+            # mostly stale, compact.
+            self.levels[level] = deque(e for e in self.levels[level] if self.entry_of.get(e[1]) is e)
+
+    def head(self, n, env) -> List[int]:
+        bitmap, entry_of = self.bitmap, self.entry_of
+        waiting = []
+        while bitmap and len(waiting) < n:
+            level = (bitmap & -bitmap).bit_length() - 1
+            bitmap &= bitmap - 1
+            self._front(level)
+            for entry in self.levels[level]:
+                if entry_of.get(entry[1]) is entry:
+                    waiting.append(((level, entry[0]), entry[1]))
+                    if len(waiting) >= n:
+                        break
+        if not env.on_running:
+            return [pid for _, pid in waiting]
+        processes, seq = env.processes, self.seq
+        candidates = [((self.level(processes[pid]), seq[pid]), pid) for pid in env.on_running] + waiting
+        candidates.sort()
+        return [pid for _, pid in candidates[:n]]
+
+    def _push(self, pid, process):
+        level = self.level(process)
+        entry = (self.seq[pid], pid)
+        queue = self.levels.setdefault(level, deque())
+        while queue and self.entry_of.get(queue[-1][1]) is not queue[-1]:
+            queue.pop()
+        if queue and queue[-1][0] > entry[0]:
+            # kept an old position (requeue without move_to_end), O(level length).
+            index = next(i for i, e in enumerate(queue) if e[0] > entry[0])
+            queue.insert(index, entry)
+        else:
+            queue.append(entry)
+        self.entry_of[pid] = entry
+        self.level_of[pid] = level
+        self.counts[level] = self.counts.get(level, 0) + 1
+        self.bitmap |= 1 << level
+        self.size += 1
+
+    def _lowest_level(self) -> int:
+        return (self.bitmap & -self.bitmap).bit_length() - 1
+
+    def _front(self, level) -> Tuple[int, int]:
+        queue = self.levels[level]
+        while self.entry_of.get(queue[0][1]) is not queue[0]:
+            queue.popleft()
+        return queue[0]
+
+
+def dynamic_priority(process, timesteps):
+    """d_prio of DP, DPMQ and MPMFQ: static priority, plus 1 for never running, minus 1 for always running."""
+    total_time = (timesteps - process.timeline.created_at) + 1
+    run_time = process.timeline.run_time / total_time
+    wait_time = 1 - run_time
+    return process.task_base.STATIC_PRIO - run_time + wait_time
+
+
+class DynamicPriorityQueue(ReadyQueue):
+    """
+    Waiting processes ordered by (level(process), -dynamic_priority, position in `env.processes`).
+
+    d_prio only moves for processes that have run: a process that never ran sits at STATIC_PRIO + 1 for good and
+    lives in a plain heap, one that has run only rises while waiting but stays below STATIC_PRIO + 1. these are
+    kept in buckets per (level, STATIC_PRIO) and re-ranked on demand, skipping every bucket whose bound can't
+    beat what is already picked.
+    """
+
+    def __init__(self, level: Callable = None):
+        super().__init__(key=None)
+        self.level = level if level else (lambda process: 0)
+        self.buckets = dict()  # (level, STATIC_PRIO) -> {pid: None} of waiting processes that have run
+        self.bucket_of = dict()
+
+    def __len__(self):
+        return len(self.heap) + len(self.bucket_of)
+
+    def __contains__(self, pid):
+        return pid in self.heap or pid in self.bucket_of
+
+    def __iter__(self):
+        yield from self.heap
+        yield from self.bucket_of
+
+    def sort_key(self, pid, process, timesteps=None):
+        if process.timeline.run_time == 0:
+            timesteps = process.timeline.created_at
+        process.d_prio = dynamic_priority(process, timesteps)
+        return self.level(process), -process.d_prio, self.seq[pid]
+
+    def peek(self, env):
+        """best waiting pid at `env.timesteps`, the order depends on time."""
+        return self.top(1, env)[0][1]
+
+    def peek_key(self) -> Tuple:
+        bounds = [self.heap.key(self.heap.peek())] if self.heap else []
+        bounds += [(level, -(static_prio + 1)) for level, static_prio in self.buckets.keys()]
+        return min(bounds)
+
+    def add(self, pid, process):
+        self.seq[pid] = self.next_seq
+        self.next_seq += 1
+        self.heap.push(pid, self.sort_key(pid, process))
+
+    def requeue(self, pid, process, move_to_end=False):
+        if move_to_end:
+            self.seq[pid] = self.next_seq
+            self.next_seq += 1
+        if process.timeline.run_time == 0:
+            self.heap.push(pid, self.sort_key(pid, process))
+        else:
+            bucket = (self.level(process), process.task_base.STATIC_PRIO)
+            self.buckets.setdefault(bucket, dict())[pid] = None
+            self.bucket_of[pid] = bucket
+
+    def remove(self, pid):
+        if pid in self.heap:
+            self.heap.remove(pid)
+            return
+        bucket = self.bucket_of.pop(pid)
+        self.buckets[bucket].pop(pid)
+        if not self.buckets[bucket]:
+            self.buckets.pop(bucket)
+
+    def top(self, n, env) -> List[Tuple[Tuple, int]]:
+        """n best waiting (sort key, pid) at `env.timesteps`, d_prio of the ranked processes is refreshed."""
+        candidates = self.heap.nsmallest(n)
+        for level, static_prio in sorted(self.buckets.keys(), key=lambda b: (b[0], -b[1])):
+            if len(candidates) >= n and candidates[-1][0][:2] <= (level, -(static_prio + 1)):
+                break
+            candidates += [(self.sort_key(pid, env.processes[pid], env.timesteps), pid)
+                           for pid in self.buckets[(level, static_prio)]]
+            candidates = heapq.nsmallest(n, candidates)
+        return candidates
+
+    def head(self, n, env) -> List[int]:
+        candidates = [(self.sort_key(pid, env.processes[pid], env.timesteps), pid) for pid in env.on_running]
+        candidates += self.top(n, env)
+        return [pid for _, pid in heapq.nsmallest(n, candidates)]
+
+
+class CFSQueue(ReadyQueue):
+    """
+    Waiting processes ordered by virtual runtime, leftmost first, like the red-black tree of CFS: O(log n) enqueue,
+    pick-next and requeue. also keeps the run queue's `min_vruntime` and `load`, the total weight of its live
+    (waiting or running) processes.
+    """
+
+    def __init__(self):
+        super().__init__(key=lambda process: (process.vruntime,))
+        self.min_vruntime = 0
+        self.load = 0
+        self.weights = dict()
+
+    def place(self, pid, process):
+        # newcomers start at min_vruntime, they neither starve the others nor get starved.
+        process.vruntime = max(process.vruntime, self.min_vruntime)
+        self.account(pid, process)
+
+    def account(self, pid, process):
+        self.weights[pid] = process.weight
+        self.load += process.weight
+
+    def add(self, pid, process):
+        self.place(pid, process)
+        super().add(pid, process)
+
+    def requeue(self, pid, process, move_to_end=False):
+        if pid not in self.seq:
+            # migrated in from another run queue, its vruntime is relative to that queue's min_vruntime (`detach`).
+            process.vruntime += self.min_vruntime
+            self.account(pid, process)
+        super().requeue(pid, process, move_to_end=move_to_end)
+
+    def discard(self, pid):
+        super().discard(pid)
+        self.load -= self.weights.pop(pid)
+
+    def detach(self, pid, process):
+        # like CFS on migration: keep only the lead over this queue's min_vruntime, the new queue adds its own.
+        super().detach(pid, process)
+        process.vruntime -= self.min_vruntime
+
+    def update_min_vruntime(self, running_vruntimes: Iterable):
+        """min_vruntime only moves forward, to the smallest vruntime of running and waiting processes."""
+        vruntimes = list(running_vruntimes)
+        if self.heap:
+            vruntimes.append(self.peek_key()[0])
+        if vruntimes:
+            self.min_vruntime = max(self.min_vruntime, min(vruntimes))
@@ -0,0 +1,259 @@
+import os
+import json
+import math
+import random
+import hashlib
+import functools
+import itertools
+import numpy as np
+from pathlib import Path
+from statistics import NormalDist
+from typing import *
+from concurrent.futures import ProcessPoolExecutor
+from hydra.utils import instantiate
+from src.run.benchmark import benchmark_single
+from src.run.batched import benchmark_batched, supports_batched
+from src.utils.workload import Workload, WorkloadCorpus, generate_random_processes, param_values
+from src.utils.trace import load_trace
+
+
+def cell_seed(base_seed: int, workload: Dict, repeat: int) -> int:
+    """
+    seed of a sweep cell, depends only on its workload and repeat index, never on worker count or order.
+    schedulers benchmarked in the same cell get the same workload.
+    """
+    key = repr((base_seed, param_values(workload), repeat))
+    return int(hashlib.sha256(key.encode()).hexdigest()[:8], 16)
+
+
+def make_workload(cell: Dict) -> Union[List, Workload]:
+    if cell.get('trace'):
+        return load_trace(**cell['trace'], **cell['workload'], cache_dir=cell.get('corpus'))
+    if cell.get('corpus'):
+        return WorkloadCorpus(cell['corpus']).get(cell['workload'], cell['seed'])
+    random.seed(cell['seed'])
+    np.random.seed(cell['seed'])
+    return generate_random_processes(**cell['workload'])
+
+
+def run_cell(cell: Dict) -> Dict:
+    """
+    :param cell: dict(scheduler=scheduler config, workload=kwargs of generate_random_processes,
+        virtual_env=kwargs of benchmark_single, seed=int, corpus=optional WorkloadCorpus directory,
+        trace=optional kwargs of load_trace, replaces the generator, `workload` then holds the swept ones)
+        a telemetry `path` of virtual_env is a directory here, every cell writes its own file in it.
+    :return: metrics
+    """
+    scheduler = instantiate(cell['scheduler'])
+    virtual_env = cell['virtual_env']
+    telemetry = virtual_env.get('telemetry')
+    if telemetry and telemetry.get('path'):
+        # cells run in any worker, they can't share a file. written aside per process, named after the cell when done.
+        path = Path(telemetry['path']) / f'{ResultCache.key(cell)[:16]}.bin'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'.tmp-{os.getpid()}-{path.name}')
+        virtual_env = virtual_env | dict(telemetry=telemetry | dict(path=tmp_path))
+    _, metrics = benchmark_single(
+        scheduler=scheduler, test_processes=make_workload(cell), verbose=False, **virtual_env)
+    if virtual_env is not cell['virtual_env'] and tmp_path.exists():
+        os.replace(tmp_path, path)
+    return metrics
+
+
+def run_repeats(cells: List[Dict], batched: bool = True) -> List[Dict]:
+    """cells that only differ by seed, run in lockstep by the batched engine if the scheduler allows."""
+    scheduler = instantiate(cells[0]['scheduler'])
+    # the batched engine has a single global run queue, no per-tick `schedule` call to profile and free dispatches.
+    virtual_env = cells[0]['virtual_env']
+    batched = batched and not virtual_env.get('profile') and all(
+        virtual_env.get(k) is None for k in ('per_core', 'cost', 'telemetry'))
+    if batched and len(cells) > 1 and supports_batched(scheduler):
+        workloads = [make_workload(cell) for cell in cells]
+        return benchmark_batched(scheduler, workloads, n_threads=virtual_env['n_threads'])
+    return [run_cell(cell) for cell in cells]
+
+
+@functools.lru_cache(maxsize=None)
+def code_fingerprint() -> str:
+    """hash of every source file under src/, a change to the simulator or a scheduler invalidates cached results."""
+    src = Path(__file__).resolve().parents[1]
+    digest = hashlib.sha256()
+    for path in sorted(src.rglob('*.py')):
+        digest.update(str(path.relative_to(src)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed store of cell metrics, one json file per hash of (scheduler config, workload params, seed,
+    virtual_env settings, `code_fingerprint`). a rerun only simulates cells that are missing, e.g. those of a newly
+    added scheduler, editing the code starts from scratch.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(cell: Dict) -> str:
+        content = dict(
+            scheduler=cell['scheduler'],
+            workload=dict(param_values(cell['workload'])),
+            seed=cell['seed'],
+            virtual_env=cell['virtual_env'],
+            code=code_fingerprint(),
+        )
+        if cell.get('trace'):
+            # a rewritten log is a different workload.
+            stat = os.stat(cell['trace']['path'])
+            content['trace'] = cell['trace'] | dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, cell: Dict) -> Path:
+        key = self.key(cell)
+        return self.root / key[:2] / f'{key}.json'
+
+    def get(self, cell: Dict) -> Optional[Dict]:
+        path = self.path(cell)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def put(self, cell: Dict, metrics: Dict):
+        path = self.path(cell)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(metrics, f)
+        os.replace(tmp_path, path)
+
+
+def run_cells(cells: List[Dict], n_workers: int = 1, batch_repeats: bool = False, cache: ResultCache = None):
+    """
+    run independent sweep cells, in-process if n_workers <= 1. results keep the order of `cells`.
+    :param batch_repeats: hand consecutive repeats of the same cell to the batched engine as one task.
+    :param cache: cells found in it are not simulated again, new results are stored as soon as they arrive.
+    """
+    results = [cache.get(cell) if cache else None for cell in cells]
+    missing = [i for i, metrics in enumerate(results) if metrics is None]
+    if batch_repeats:
+        tasks = [list(group) for _, group in itertools.groupby(
+            missing, key=lambda i: repr((cells[i]['scheduler'], cells[i]['workload'], cells[i]['virtual_env'])))]
+    else:
+        tasks = [[i] for i in missing]
+    run = functools.partial(run_repeats, batched=batch_repeats)
+    task_cells = [[cells[i] for i in task] for task in tasks]
+
+    def completed():
+        if n_workers <= 1:
+            yield from map(run, task_cells)
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                yield from pool.map(run, task_cells, chunksize=max(1, len(tasks) // (n_workers * 4)))
+
+    for task, metrics in zip(tasks, completed()):
+        for i, metric in zip(task, metrics):
+            results[i] = metric
+            if cache:
+                cache.put(cells[i], metric)
+    return results
+
+
+def t_central(t: float, df: int) -> float:
+    """P(|T| < t) of student's t with integer df, the finite series of abramowitz & stegun 26.7.3 / 26.7.4."""
+    theta = math.atan(t / math.sqrt(df))
+    c2 = math.cos(theta) ** 2
+    term, total = 1.0, 1.0
+    for k in range(2 if df % 2 else 1, df - 1, 2):
+        term *= c2 * k / (k + 1)
+        total += term
+    if df % 2 == 0:
+        return math.sin(theta) * total
+    if df == 1:
+        return 2 * theta / math.pi
+    return 2 / math.pi * (theta + math.sin(theta) * math.cos(theta) * total)
+
+
+def t_quantile(p: float, df: int) -> float:
+    """
+    student's t quantile. small df, where the cornish-fisher expansion around the normal quantile is several
+    percent too small (9.71 instead of 12.71 at df=1, p=0.975), invert the exact cdf; the expansion is within
+    0.1% for df >= 8.
+    """
+    if df < 8:
+        if p < 0.5:
+            return -t_quantile(1 - p, df)
+        lo, hi = 0.0, 1.0
+        while t_central(hi, df) < 2 * p - 1:
+            hi *= 2
+        for _ in range(100):
+            mid = (lo + hi) / 2
+            lo, hi = (mid, hi) if t_central(mid, df) < 2 * p - 1 else (lo, mid)
+        return (lo + hi) / 2
+    z = NormalDist().inv_cdf(p)
+    return (z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3))
+
+
+def mean_interval(values, confidence: float = 0.95, axis=-1) -> Tuple[np.ndarray, np.ndarray]:
+    """mean and half width of its `confidence` interval along `axis`, the half width is 0 for a single value."""
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[axis]
+    mean = values.mean(axis=axis)
+    if n < 2:
+        return mean, np.zeros_like(mean)
+    sem = values.std(axis=axis, ddof=1) / math.sqrt(n)
+    return mean, t_quantile((1 + confidence) / 2, n - 1) * sem
+
+
+def converged(runs: List[List[Dict]], metrics: List[str], rel_tol: float, confidence: float) -> bool:
+    """
+    whether every two cells of `runs` (metrics of each repeat, one list per cell) are ranked, for each of `metrics`:
+    the `confidence` interval of their mean paired difference excludes 0, or is within `rel_tol` of the metric's mean.
+    """
+    if len(runs[0]) < 2:
+        return False
+    for key in metrics:
+        values = np.array([[metric[key] for metric in repeats] for repeats in runs])
+        diff, half = mean_interval(values[:, None] - values[None], confidence)
+        if not np.all((np.abs(diff) > half) | (half <= rel_tol * abs(values.mean()))):
+            return False
+    return True
+
+
+def run_sequential(
+        groups: List[List[Dict]],
+        base_seed: int,
+        max_repeats: int,
+        metrics: List[str],
+        min_repeats: int = 5,
+        step: int = 5,
+        rel_tol: float = 0.05,
+        confidence: float = 0.95,
+        **kwargs,
+) -> List[List[List[Dict]]]:
+    """
+    Repeats with common random numbers and sequential stopping. cells of a group (e.g. one per scheduler) see the
+    same seeded workloads, `step` more repeats are run for all of them until `converged` or `max_repeats`.
+    groups still running are simulated together, so workers and the cache are shared like in `run_cells`.
+    :param groups: cells without seed, those of a group share the workload.
+    :param kwargs: of `run_cells`.
+    :return: metrics of every repeat, per group and cell.
+    """
+    runs = [[[] for _ in group] for group in groups]
+    running = list(range(len(groups)))
+    while running:
+        cells, owners = [], []
+        for g in running:
+            n = len(runs[g][0])
+            for c, cell in enumerate(groups[g]):
+                for repeat in range(n, min(max(min_repeats, n + step), max_repeats)):
+                    cells.append(cell | dict(seed=cell_seed(base_seed, cell['workload'], repeat)))
+                    owners.append((g, c))
+        for (g, c), metric in zip(owners, run_cells(cells, **kwargs)):
+            runs[g][c].append(metric)
+        running = [g for g in running
+                   if len(runs[g][0]) < max_repeats and not converged(runs[g], metrics, rel_tol, confidence)]
+    return runs
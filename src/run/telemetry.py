@@ -0,0 +1,103 @@
+import functools
+import numpy as np
+from pathlib import Path
+from typing import *
+
+
+MAGIC = b'PSBTEL1\n'
+
+
+class Telemetry:
+    """
+    System state over time, sampled every `stride` timesteps into a preallocated ring buffer of `capacity` rows.
+    a sample holds the state a tick runs with, after the scheduler's decision. ticks jumped over by the event engine
+    run with the same state, so they are sampled too.
+    with `path`, every full buffer is appended to that file (`MAGIC`, field names, then raw int64 rows) instead of
+    being overwritten, `flush` writes the rest. copies of the env keep their samples in memory only.
+    envs without it pay nothing, attached ones a call and a comparison per `_run` / `dispatch`.
+    """
+    FIELDS = ('timestep', 'ready_queue_len', 'running', 'idle_cpus', 'dispatches', 'live', 'finished')
+
+    def __init__(self, stride: int = 1, capacity: int = 1 << 16, path=None):
+        self.stride = stride
+        self.buffer = np.zeros((capacity, len(self.FIELDS)), dtype=np.int64)
+        self.path = Path(path) if path is not None else None
+        self.n_samples = 0  # ever taken
+        self.n_flushed = 0  # of them written to `path`
+        self.next_sample = 0  # timestep
+        self.dispatches = 0  # since the last sample
+
+    def __getstate__(self):
+        return self.__dict__ | dict(path=None)
+
+    def __len__(self):
+        """samples in the buffer."""
+        return min(self.n_samples, len(self.buffer)) if self.path is None else self.n_samples - self.n_flushed
+
+    def attach(self, env):
+        self.next_sample = env.timesteps
+        env.dispatch = functools.partial(self.dispatch, env.dispatch)
+        env._run = functools.partial(self.run, env, env._run)
+
+    def dispatch(self, dispatch, pid):
+        self.dispatches += 1
+        dispatch(pid)
+
+    def run(self, env, run, n_ticks):
+        end = env.timesteps + n_ticks
+        if end > self.next_sample:
+            running = len(env.on_running)
+            self.record(range(self.next_sample, end, self.stride), (
+                len(env.ready_queue), running, max(env.n_threads - running, 0), 0,
+                len(env.processes), env.n_created - len(env.processes)))
+        run(n_ticks)
+
+    def record(self, timesteps: range, state: Tuple):
+        """samples at `timesteps` with the same state, dispatches are counted in the first one."""
+        i = 0
+        while i < len(timesteps):
+            if self.path is None:
+                row = self.n_samples % len(self.buffer)
+            else:
+                if self.n_samples - self.n_flushed == len(self.buffer):
+                    self.flush()
+                row = self.n_samples - self.n_flushed
+            n = min(len(timesteps) - i, len(self.buffer) - row)
+            if n == 1:
+                # most calls take a single sample, a row assignment is cheaper than two slices.
+                self.buffer[row] = (timesteps[i],) + state
+            else:
+                self.buffer[row:row + n, 0] = timesteps[i:i + n]
+                self.buffer[row:row + n, 1:] = state
+            if i == 0:
+                self.buffer[row, 4] = self.dispatches
+                self.dispatches = 0
+            self.n_samples += n
+            i += n
+        self.next_sample = timesteps[-1] + self.stride
+
+    def flush(self):
+        """append the buffered samples to `path`."""
+        if self.path is None or len(self) == 0:
+            return
+        with open(self.path, 'ab' if self.n_flushed else 'wb') as f:
+            if not self.n_flushed:
+                f.write(MAGIC + ' '.join(self.FIELDS).encode() + b'\n')
+            f.write(self.buffer[:len(self)].astype('<i8').tobytes())
+        self.n_flushed = self.n_samples
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """buffered samples in time order, field -> column."""
+        rows = self.buffer[:len(self)]
+        if self.path is None and self.n_samples > len(self.buffer):
+            rows = np.roll(self.buffer, -(self.n_samples % len(self.buffer)), axis=0)
+        return {field: rows[:, i].copy() for i, field in enumerate(self.FIELDS)}
+
+    @staticmethod
+    def load(path) -> Dict[str, np.ndarray]:
+        """every sample written to `path`, field -> column."""
+        with open(path, 'rb') as f:
+            assert f.readline() == MAGIC, f'{path} is not a telemetry file.'
+            fields = f.readline().decode().split()
+            rows = np.frombuffer(f.read(), dtype='<i8').reshape(-1, len(fields))
+        return {field: rows[:, i] for i, field in enumerate(fields)}
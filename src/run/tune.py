@@ -0,0 +1,85 @@
+import math
+import numpy as np
+from typing import *
+from src.run.sweep import cell_seed, run_cells
+
+
+def sample_params(space: Dict, rng: np.random.Generator) -> Dict:
+    """
+    one draw of a parameter space, name -> list of choices, or dict(low=, high=, log=False). ranges with int bounds
+    give ints, log ones are sampled uniformly in log space.
+    """
+    params = dict()
+    for name, spec in space.items():
+        if not isinstance(spec, dict):
+            params[name] = spec[rng.integers(len(spec))]
+            continue
+        low, high = spec['low'], spec['high']
+        if spec.get('log'):
+            value = math.exp(rng.uniform(math.log(low), math.log(high)))
+        else:
+            value = rng.uniform(low, high)
+        if isinstance(low, int) and isinstance(high, int):
+            params[name] = min(int(round(value)), high)
+        else:
+            params[name] = round(float(value), 4)
+    return params
+
+
+def sample_candidates(scheduler: Dict, space: Dict, n_candidates: int, seed: int = 0) -> List[Dict]:
+    """`scheduler` config itself, then up to n_candidates - 1 distinct random variations of the params in `space`."""
+    rng = np.random.default_rng(seed)
+    candidates, seen = [scheduler], {repr(sorted(scheduler.items()))}
+    # small discrete spaces run out of distinct candidates, don't draw forever.
+    for _ in range(20 * n_candidates):
+        if len(candidates) >= n_candidates:
+            break
+        candidate = scheduler | sample_params(space, rng)
+        key = repr(sorted(candidate.items()))
+        if key not in seen:
+            seen.add(key)
+            candidates.append(candidate)
+    return candidates
+
+
+def successive_halving(
+        candidates: List[Dict],
+        cell: Dict,
+        base_seed: int,
+        metric: str,
+        maximize: bool = False,
+        eta: int = 3,
+        min_repeats: int = 2,
+        max_repeats: int = 54,
+        **kwargs,
+) -> List[Tuple[Dict, float, int]]:
+    """
+    Successive halving over workload repeats: every candidate runs `min_repeats` workloads, the best 1 / eta of
+    them get eta times as many, and so on until one is left or `max_repeats` is reached. all candidates see the
+    same seeded workloads, a rung only simulates the repeats its survivors haven't run yet.
+    :param candidates: scheduler configs.
+    :param cell: sweep cell without scheduler and seed, i.e. workload, virtual_env, corpus.
+    :param metric: key of the metrics to minimize, or maximize.
+    :param kwargs: of `run_cells`, e.g. n_workers.
+    :return: (candidate, mean metric, repeats run) of every candidate, best first. those that went further rank
+        higher, whatever their mean on fewer workloads.
+    """
+    runs = [[] for _ in candidates]
+    score = lambda i: float(np.mean([metrics[metric] for metrics in runs[i]])) * (-1 if maximize else 1)
+    alive, n_repeats = list(range(len(candidates))), min(min_repeats, max_repeats)
+    while True:
+        cells, owners = [], []
+        for i in alive:
+            for repeat in range(len(runs[i]), n_repeats):
+                cells.append(cell | dict(
+                    scheduler=candidates[i], seed=cell_seed(base_seed, cell['workload'], repeat)))
+                owners.append(i)
+        for i, metrics in zip(owners, run_cells(cells, **kwargs)):
+            runs[i].append(metrics)
+        if len(alive) <= 1 or n_repeats >= max_repeats:
+            break
+        alive = sorted(alive, key=score)[:max(1, len(alive) // eta)]
+        n_repeats = min(n_repeats * eta, max_repeats)
+
+    ranking = sorted(range(len(candidates)), key=lambda i: (-len(runs[i]), score(i)))
+    return [(candidates[i], score(i) * (-1 if maximize else 1), len(runs[i])) for i in ranking]
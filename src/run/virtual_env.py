@@ -1,18 +1,141 @@
+import copy
+import math
+import heapq
+import random
+import functools
 from typing import *
 from colorcet import OrderedDict
 from src.process.process import ProcessBase
 from src.process.process import ProcessState as PSt
 
 
+def new_process(scheduler, pid, timesteps, CPU_TIME_NEEDED_TOTAL, name=None, is_user_task=False, STATIC_PRIO=4):
+    process = scheduler.wrap_task(ProcessBase(
+        pid=pid,
+        name=name,
+        is_user_task=is_user_task,
+        CPU_TIME_NEEDED_TOTAL=CPU_TIME_NEEDED_TOTAL,
+        STATIC_PRIO=STATIC_PRIO
+    ))
+    process.timeline.append((timesteps, PSt.CREATE))
+    return process
+
+
+class RunningSet(dict):
+    """pids on cpu in dispatch order. used like the list it replaces, but membership and removal are O(1)."""
+    __slots__ = ()
+    append = dict.setdefault  # pid -> None
+    remove = dict.__delitem__
+
+
+class CopyOnWriteProcesses(OrderedDict):
+    """
+    `env.processes` of a forked env. processes listed in `shared` are still shared with other forks and are
+    replaced by a private copy the first time they are read from here, as any read may be followed by a write.
+    """
+
+    def __init__(self, processes=(), shared: Set[int] = None):
+        super().__init__(processes)
+        self.shared = shared if shared is not None else set()
+
+    def __getitem__(self, pid):
+        process = super().__getitem__(pid)
+        if self.shared and pid in self.shared:
+            self.shared.remove(pid)
+            process = copy.copy(process)
+            super().__setitem__(pid, process)
+        return process
+
+    def get(self, pid, default=None):
+        return self[pid] if pid in self else default
+
+    def pop(self, pid, *default):
+        if pid in self:
+            self[pid]
+        return super().pop(pid, *default)
+
+    def values(self):
+        return [self[pid] for pid in self]
+
+    def items(self):
+        return [(pid, self[pid]) for pid in self]
+
+    def __deepcopy__(self, memo):
+        return CopyOnWriteProcesses(
+            ((pid, copy.deepcopy(process, memo)) for pid, process in super().items()), set(self.shared))
+
+
+def fork(env, *attached):
+    """
+    cheap copy of an env (and of `attached` objects referencing it, e.g. a metric accumulator) to branch a run
+    into what-if continuations. everything is copied except the processes, which the two envs share until one of
+    them touches a process and makes its own copy. both envs can be advanced independently afterwards.
+    :return: the new env, followed by the copies of `attached`.
+    """
+    tables = env.process_tables()
+    memo = {id(process): process for table in tables + [env.processes_done] for process in dict.values(table)}
+    twins = copy.deepcopy((env,) + attached, memo)
+    for e in (env, twins[0]):
+        e.share_processes()
+    return twins if attached else twins[0]
+
+
+class CostModel:
+    """
+    Virtual cpu time lost to scheduling. it is burnt on cpu by the process being switched in before it makes
+    progress again, so it shows up as lost throughput and longer TAT / RT, but not in its time slice.
+    :param context_switch: ticks per dispatch.
+    :param migration: ticks per move to another core's run queue, see `MultiCoreEnv`.
+    :param decision: ticks per waiting process for picking one to dispatch, e.g. 0.01 is a tick per 100 waiting.
+    fractional costs are summed per env and charged as whole ticks once they add up.
+    """
+
+    def __init__(self, context_switch: float = 0, migration: float = 0, decision: float = 0.):
+        self.context_switch = context_switch
+        self.migration = migration
+        self.decision = decision
+
+
 class VirtualEnv:
 
-    def __init__(self, scheduler, n_threads=1):
+    def __init__(
+            self, scheduler, n_threads=1, on_finish: Callable = None, profiler=None, cost: CostModel = None,
+            telemetry=None):
+        """
+        :param on_finish: called with every finished process, which is then dropped instead of being kept
+            in `processes_done`. keeps memory bounded by the live processes.
+        :param profiler: e.g. `TickProfiler`, takes over `tick` to time it. unprofiled ticks pay nothing for it.
+        :param cost: charge dispatches with virtual cpu time, free if None.
+        :param telemetry: e.g. `Telemetry`, samples queue length, running set, idle cpus and dispatches over time.
+        """
         self.processes = OrderedDict()
         self.processes_done = OrderedDict()
-        self.on_running = list()
+        self.on_finish = on_finish
+        self.n_created = 0
+        self.on_running = RunningSet()
+        self.ready_queue = scheduler.make_ready_queue()
         self.scheduler = scheduler
         self.timesteps = 0
         self.n_threads = n_threads
+        self.cost = cost
+        self.cost_debt = 0.  # charged but not yet whole ticks
+        self.overhead_ticks = 0  # cpu ticks burnt on scheduling costs
+        if profiler is not None:
+            self.tick = functools.partial(profiler.tick, self)
+        if telemetry is not None:
+            telemetry.attach(self)
+
+    def snapshot(self) -> 'VirtualEnv':
+        """independent deep copy of the env and its scheduler. fork it to go back to this point, any number of times."""
+        return copy.deepcopy(self)
+
+    def process_tables(self) -> List[Dict]:
+        """the dicts holding live processes."""
+        return [self.processes]
+
+    def share_processes(self):
+        # after a fork: every live process may be shared, copy before use.
+        self.processes = CopyOnWriteProcesses(OrderedDict.items(self.processes), set(self.processes))
 
     def add_new_process(
             self,
@@ -22,35 +145,354 @@ class VirtualEnv:
             STATIC_PRIO=4,
             **kwargs,
     ):
-        def alloc_pid() -> int:
-            return len(self.processes) + len(self.processes_done)
-
-        pid = alloc_pid()
-        new_process = ProcessBase(
-            pid=pid,
-            name=name,
-            is_user_task=is_user_task,
-            CPU_TIME_NEEDED_TOTAL=CPU_TIME_NEEDED_TOTAL,
-            STATIC_PRIO=STATIC_PRIO
-        )
-        self.processes[pid] = self.scheduler.wrap_task(new_process)
-        self.processes[pid].timeline.append((self.timesteps, PSt.CREATE))
+        pid = self.n_created
+        self.n_created += 1
+        self.processes[pid] = new_process(
+            self.scheduler, pid, self.timesteps, CPU_TIME_NEEDED_TOTAL, name, is_user_task, STATIC_PRIO)
+        self.ready_queue.add(pid, self.processes[pid])
+
+    def dispatch(self, pid):
+        if self.cost is not None:
+            self.charge(pid, self.cost.context_switch + self.cost.decision * len(self.ready_queue))
+        self.ready_queue.remove(pid)
+        self.on_running.append(pid)
+        self.processes[pid].timeline.append((self.timesteps, PSt.START_RUNNING))
+
+    def preempt(self, pid, move_to_end=False):
+        """
+        :param move_to_end: requeue behind all other processes, otherwise keep its place in `processes`.
+        """
+        self.on_running.remove(pid)
+        self.processes[pid].timeline.append((self.timesteps, PSt.PAUSE_RUNNING))
+        if move_to_end:
+            self.processes.move_to_end(pid)
+        self.ready_queue.requeue(pid, self.processes[pid], move_to_end=move_to_end)
+
+    def charge(self, pid, ticks):
+        """add scheduling cost to what the process burns the next time it is on cpu."""
+        self.cost_debt += ticks
+        n_ticks = int(self.cost_debt)
+        self.cost_debt -= n_ticks
+        self.processes[pid].stall += n_ticks
+
+    def head(self, n) -> List[int]:
+        """first n pids by the scheduler's `ready_key`, running ones included."""
+        return self.ready_queue.head(n, self)
 
     def tick(self):
         self.scheduler.schedule(self)
+        self._run(n_ticks=1)
+
+    def advance(self, horizon=math.inf):
+        """
+        move virtual time forward, at least one tick and never past `horizon` (e.g. the next arrival).
+        the tick engine always moves exactly one tick.
+        """
+        self.tick()
 
+    def _run(self, n_ticks):
+        # let processes on cpu run for `n_ticks`, running set is assumed unchanged in the meantime.
         finished_process_pids = []
         for pid in self.on_running:
-            self.processes[pid].CPU_TIME_NEEDED -= 1
-            self.processes[pid].timeline.append((self.timesteps, PSt.RUNNING))
-            if self.processes[pid].CPU_TIME_NEEDED <= 0:
-                process = self.processes.pop(pid)
-                process.timeline.append((self.timesteps + 1, PSt.FINISHED))
-                self.processes_done[pid] = process
+            process = self.processes[pid]
+            progress = n_ticks
+            if process.stall:
+                stalled = min(process.stall, n_ticks)
+                process.stall -= stalled
+                progress -= stalled
+                self.overhead_ticks += stalled
+                # switching in doesn't use up the time slice, short slices would never make progress otherwise.
+                if getattr(process, 'slice_cnt', -1) >= 0:
+                    process.slice_cnt += stalled
+            process.CPU_TIME_NEEDED -= progress
+            process.timeline.run(self.timesteps, n_ticks)
+            if process.CPU_TIME_NEEDED <= 0:
+                self.processes.pop(pid)
+                self.ready_queue.discard(pid)
+                process.timeline.append((self.timesteps + n_ticks, PSt.FINISHED))
+                if self.on_finish is None:
+                    self.processes_done[pid] = process
+                else:
+                    self.on_finish(process)
 
                 finished_process_pids.append(pid)
 
         for pid in finished_process_pids:
             self.on_running.remove(pid)
 
-        self.timesteps += 1
\ No newline at end of file
+        self.timesteps += n_ticks
+
+
+class EventDrivenEnv(VirtualEnv):
+    """
+    Discrete-event version of VirtualEnv. after every real tick it jumps straight to the next event:
+    an arrival (`horizon`), a completion, or whatever the scheduler reports via `quiet_ticks`
+    (e.g. time slice expiry). timelines and metrics are identical to the tick engine.
+    a jump costs a `quiet_ticks` query per tick, so this only wins when arrivals are sparse and there are long
+    quiet stretches; on dense workloads preemptive schedulers decide almost every tick and it is no faster.
+    """
+
+    def advance(self, horizon=math.inf):
+        self.tick()
+        n_ticks = min(self.quiet_ticks(), horizon - self.timesteps)
+        if 0 < n_ticks < math.inf:
+            self.scheduler.skip(self, n_ticks)
+            self._run(n_ticks)
+
+    def quiet_ticks(self):
+        if not self.processes:
+            return math.inf
+        # running set can't change before the first completion.
+        n_ticks = self.scheduler.quiet_ticks(self)
+        for pid in self.on_running:
+            process = self.processes[pid]
+            n_ticks = min(n_ticks, process.CPU_TIME_NEEDED + process.stall)
+        return n_ticks
+
+
+class Core(EventDrivenEnv):
+    """
+    One cpu of a `MultiCoreEnv`: its own processes, ready queue and clock, scheduled by the unchanged policy
+    as a single-thread env. waiting processes can be taken out (`release`) and put in (`adopt`) by the balancer.
+    """
+
+    def __init__(self, scheduler, core_id, on_finish: Callable, profiler=None, cost: CostModel = None):
+        super().__init__(scheduler, n_threads=1, on_finish=on_finish, profiler=profiler, cost=cost)
+        self.core_id = core_id
+        self.busy_ticks = 0
+        self.is_idle = True
+        self.tracked_len = 0  # ready queue length last reported to the env's steal heap
+
+    def adopt(self, pid, process, migrated=False):
+        self.processes[pid] = process
+        if migrated:
+            # may have run elsewhere, queue it like a paused process.
+            self.ready_queue.requeue(pid, process, move_to_end=True)
+            if self.cost is not None:
+                self.charge(pid, self.cost.migration)
+        else:
+            self.ready_queue.add(pid, process)
+
+    def release(self, pid):
+        self.ready_queue.detach(pid, self.processes[pid])
+        return self.processes.pop(pid)
+
+    def migratable(self) -> Optional[int]:
+        """the waiting process queued last, or None."""
+        for pid in reversed(self.processes):
+            if pid not in self.on_running:
+                return pid
+        return None
+
+    def quiet_ticks(self):
+        # stop as soon as the core runs dry, it may steal work then.
+        return super().quiet_ticks() if self.processes else 0
+
+    def _run(self, n_ticks):
+        self.busy_ticks += n_ticks * len(self.on_running)
+        super()._run(n_ticks)
+
+
+class MultiCoreEnv:
+    """
+    `n_threads` cpus with a run queue each (`Core`) instead of one global queue. new processes go to an idle core,
+    else to the less loaded of two random ones. every `balance_interval` ticks waiting processes are moved from
+    the busiest to the idlest cores, and a core that runs dry steals one from the core with the longest queue.
+
+    cores are advanced independently by their own event-driven clocks, ordered in a heap by the time of their
+    next decision, so an event costs O(log n_threads) plus the core's own `schedule`, idle cores cost nothing.
+    arrivals and balancing are horizons for every core, so all busy cores are in sync whenever processes move in.
+    """
+
+    def __init__(
+            self,
+            scheduler,
+            n_threads=1,
+            on_finish: Callable = None,
+            profiler=None,
+            cost: CostModel = None,
+            balance_interval: int = 64,
+            work_stealing: bool = True,
+            seed: int = 0,
+    ):
+        """
+        :param balance_interval: ticks between periodic load balancing, null / 0 to never balance.
+        :param work_stealing: a core without processes pulls a waiting one from the longest queue.
+        :param seed: placement randomness.
+        """
+        self.scheduler = scheduler
+        self.n_threads = n_threads
+        self.processes = OrderedDict()  # live processes of all cores
+        self.processes_done = OrderedDict()
+        self.on_finish = on_finish
+        self.n_created = 0
+        self.timesteps = 0
+        self.first_arrival = None
+        self.cores = [
+            Core(scheduler, i, on_finish=self._finish, profiler=profiler, cost=cost) for i in range(n_threads)]
+        self.events = []  # (clock, core_id) of cores with processes, one entry each
+        self.idle = list(range(n_threads))  # heap of core ids, stale entries skipped by `is_idle`
+        self.queues = []  # heap of (-ready queue length, core_id), stale entries skipped by `tracked_len`
+        self.balance_interval = balance_interval
+        self.next_balance = balance_interval if balance_interval else math.inf
+        self.work_stealing = work_stealing
+        self.rng = random.Random(seed)
+        self.migrations = 0
+        self.steals = 0
+
+    def snapshot(self) -> 'MultiCoreEnv':
+        return copy.deepcopy(self)
+
+    def process_tables(self) -> List[Dict]:
+        return [self.processes] + [core.processes for core in self.cores]
+
+    def share_processes(self):
+        self.processes = CopyOnWriteProcesses(OrderedDict.items(self.processes), set(self.processes))
+        for core in self.cores:
+            core.share_processes()
+
+    def add_new_process(
+            self,
+            CPU_TIME_NEEDED_TOTAL: int,
+            name: str = None,
+            is_user_task: bool = False,
+            STATIC_PRIO=4,
+            **kwargs,
+    ):
+        pid = self.n_created
+        self.n_created += 1
+        if self.first_arrival is None:
+            self.first_arrival = self.timesteps
+        process = new_process(
+            self.scheduler, pid, self.timesteps, CPU_TIME_NEEDED_TOTAL, name, is_user_task, STATIC_PRIO)
+        self.processes[pid] = process
+        core = self._pop_idle() or self._less_loaded(*self.rng.choices(self.cores, k=2))
+        self._activate(core)
+        core.adopt(pid, process)
+        self._track(core)
+
+    def advance(self, horizon=math.inf):
+        if not self.processes:
+            # nothing to run or balance until the next arrival.
+            for _, core_id in self.events:
+                self._set_idle(self.cores[core_id])
+            self.events.clear()
+            self.timesteps = max(self.timesteps + 1, horizon)
+            if self.balance_interval:
+                self.next_balance = max(
+                    self.next_balance, (self.timesteps // self.balance_interval + 1) * self.balance_interval)
+            return
+
+        while self.timesteps >= self.next_balance:
+            self.balance()
+            self.next_balance += self.balance_interval
+
+        due = []
+        while self.events and self.events[0][0] <= self.timesteps:
+            core = self.cores[heapq.heappop(self.events)[1]]
+            if core.processes or (self.work_stealing and self._steal(core)):
+                due.append(core)
+            else:
+                self._set_idle(core)
+
+        # nobody may run past the next point where processes could move onto it.
+        horizon = min(horizon, self.next_balance, self.events[0][0] if self.events else math.inf)
+        for core in due:
+            core.advance(horizon=horizon)
+            heapq.heappush(self.events, (core.timesteps, core.core_id))
+            self._track(core)
+        self.timesteps = min(horizon, self.events[0][0] if self.events else math.inf)
+
+    def balance(self):
+        """move waiting processes from the busiest to the idlest cores until every core is within 1 of the mean."""
+        cores = sorted(self.cores, key=lambda c: (len(c.processes), c.core_id))
+        total = sum(len(c.processes) for c in cores)
+        low, high = total // len(cores), -(-total // len(cores))
+        lo, hi = 0, len(cores) - 1
+        while lo < hi:
+            src, dst = cores[hi], cores[lo]
+            if len(src.processes) <= high:
+                hi -= 1
+            elif len(dst.processes) >= low:
+                lo += 1
+            elif not self._migrate(src, dst):
+                hi -= 1
+
+    def stats(self) -> Dict:
+        """migrations, work steals and per-core utilization over the makespan (min / mean / max over cores)."""
+        utilization = self.core_utilization()
+        return dict(
+            migrations=self.migrations,
+            steals=self.steals,
+            core_utilization_min=float(min(utilization)),
+            core_utilization_mean=float(sum(utilization) / len(utilization)),
+            core_utilization_max=float(max(utilization)),
+        )
+
+    @property
+    def overhead_ticks(self) -> int:
+        return sum(core.overhead_ticks for core in self.cores)
+
+    def core_utilization(self) -> List[float]:
+        makespan = max(self.timesteps - (self.first_arrival or 0), 1)
+        return [core.busy_ticks / makespan for core in self.cores]
+
+    def _steal(self, core) -> bool:
+        # the core with the longest ready queue, lowest id first.
+        while self.queues and -self.queues[0][0] != self.cores[self.queues[0][1]].tracked_len:
+            heapq.heappop(self.queues)
+        if not self.queues or not self._migrate(self.cores[self.queues[0][1]], core):
+            return False
+        self.steals += 1
+        return True
+
+    def _track(self, core):
+        n = len(core.ready_queue)
+        if n == core.tracked_len:
+            return
+        core.tracked_len = n
+        if n:
+            heapq.heappush(self.queues, (-n, core.core_id))
+        if len(self.queues) > 4 * len(self.cores):
+            self.queues = [(-c.tracked_len, c.core_id) for c in self.cores if c.tracked_len]
+            heapq.heapify(self.queues)
+
+    def _migrate(self, src, dst) -> bool:
+        pid = src.migratable()
+        if pid is None:
+            return False
+        self._activate(dst)
+        dst.adopt(pid, src.release(pid), migrated=True)
+        self._track(src)
+        self._track(dst)
+        self.migrations += 1
+        return True
+
+    def _activate(self, core):
+        if core.is_idle:
+            core.is_idle = False
+            core.timesteps = self.timesteps
+            heapq.heappush(self.events, (core.timesteps, core.core_id))
+
+    def _set_idle(self, core):
+        core.is_idle = True
+        heapq.heappush(self.idle, core.core_id)
+
+    def _pop_idle(self) -> Optional[Core]:
+        while self.idle:
+            core = self.cores[heapq.heappop(self.idle)]
+            if core.is_idle:
+                return core
+        return None
+
+    @staticmethod
+    def _less_loaded(a, b) -> Core:
+        return min(a, b, key=lambda c: (len(c.processes), c.core_id))
+
+    def _finish(self, process):
+        pid = process.task_base.pid
+        self.processes.pop(pid)
+        if self.on_finish is None:
+            self.processes_done[pid] = process
+        else:
+            self.on_finish(process)
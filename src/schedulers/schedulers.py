@@ -1,10 +1,17 @@
+import math
+import heapq
+from typing import *
 from src.run.virtual_env import VirtualEnv
+from src.run.ready_queue import ReadyQueue, MultiLevelQueue, DynamicPriorityQueue, CFSQueue
 from src.process.process import ProcessBase
 from src.process.wrapped_process import WrappedProcess
-from src.process.process import ProcessState as PSt
 
 
 class SchedulerBase:
+    # False: a dispatched process always runs to completion and waiting ones are picked by `ready_key`,
+    # so the whole schedule can be computed without ticking, see `src.run.analytical`.
+    is_preemptive = True
+
     def __init__(self,*args, **kwargs):
         self.schedule_times = 0
 
@@ -17,24 +24,82 @@ class SchedulerBase:
     def wrap_task(self, task: ProcessBase) -> WrappedProcess:
         return WrappedProcess(task)
 
+    def ready_key(self, process: WrappedProcess) -> Tuple:
+        """
+        order of waiting processes in `env.ready_queue`, ties go to the earlier one in `env.processes`.
+        must not change while a process waits. () is plain FIFO.
+        """
+        return ()
+
+    def make_ready_queue(self) -> ReadyQueue:
+        if type(self).ready_key is SchedulerBase.ready_key:
+            # plain FIFO, a single-level queue is O(1) where the heap is O(log n).
+            return MultiLevelQueue(level=lambda process: 0)
+        return ReadyQueue(key=self.ready_key)
+
     def schedule(self, env: VirtualEnv) -> None:
         raise NotImplementedError
 
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        """
+        number of upcoming ticks in which `schedule` is known to change nothing but per-tick counters,
+        assuming no arrival and no completion meanwhile. 0 means unknown, the env has to tick normally.
+        """
+        return 0
+
+    def skip(self, env: VirtualEnv, n_ticks: int) -> None:
+        """apply the per-tick bookkeeping of `n_ticks` quiet `schedule` calls at once."""
+        pass
+
+    @staticmethod
+    def _nothing_to_dispatch(env: VirtualEnv) -> bool:
+        return len(env.on_running) >= env.n_threads or len(env.processes) <= len(env.on_running)
+
+    @staticmethod
+    def _ticks_until_slice_expires(env: VirtualEnv) -> float:
+        # a running process is paused at the first tick its slice_cnt is 0, negative ones never expire.
+        n_ticks = math.inf
+        for pid in env.on_running:
+            slice_cnt = env.processes[pid].slice_cnt
+            if slice_cnt >= 0:
+                n_ticks = min(n_ticks, slice_cnt)
+        return n_ticks
+
+    @staticmethod
+    def _ahead_of_waiting(env: VirtualEnv) -> bool:
+        # multi-level queues (sort key starts with queue_index): if n_threads running processes sit in a
+        # strictly higher queue than every waiting one, no waiting process can make it into the top n_threads.
+        top_waiting_queue = env.ready_queue.peek_key()[0] if env.ready_queue else math.inf
+        n_ahead = sum(env.processes[pid].queue_index < top_waiting_queue for pid in env.on_running)
+        return n_ahead >= min(env.n_threads, len(env.processes))
+
+    @staticmethod
+    def _consume_slices(env: VirtualEnv, n_ticks: int) -> None:
+        for pid in env.on_running:
+            env.processes[pid].slice_cnt -= n_ticks
+
 
 class FCFS(SchedulerBase):
     """First-Come, First-Served"""
+    is_preemptive = False
+
+    def ready_key(self, process: WrappedProcess) -> Tuple:
+        return process.task_base.pid,
+
     def schedule(self, env: VirtualEnv) -> None:
         if len(env.on_running) == env.n_threads:
             return
 
-        for pid in sorted(env.processes.keys())[:env.n_threads]:
+        for pid in env.head(env.n_threads):
             # first came job has smalled pid.
             if pid not in env.on_running and len(env.on_running) < env.n_threads:
-                env.on_running.append(pid)
-                env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                env.dispatch(pid)
 
                 self.schedule_times += 1
 
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        return math.inf if self._nothing_to_dispatch(env) else 0
+
 
 class SJF(SchedulerBase):
     """Shortest-Job-First, SJF"""
@@ -45,45 +110,59 @@ class SJF(SchedulerBase):
     def __str__(self):
         return 'SJF' if not self.is_preemptive else 'SJG_Preemptive'
 
+    def ready_key(self, process: WrappedProcess) -> Tuple:
+        return process.CPU_TIME_NEEDED,
+
     def schedule(self, env: VirtualEnv) -> None:
 
-        for pid, _ in sorted(env.processes.items(), key=lambda kv: kv[-1].CPU_TIME_NEEDED)[:env.n_threads]:
+        for pid in env.head(env.n_threads):
             # first came job has smalled pid.
             if len(env.on_running) < env.n_threads:
                 if pid not in env.on_running:
-                    env.on_running.append(pid)
-                    env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                    env.dispatch(pid)
 
                     self.schedule_times += 1
 
             elif self.is_preemptive:
                 if pid not in env.on_running:
                     pid_to_pause = max(env.on_running, key=lambda x: env.processes[x].CPU_TIME_NEEDED)
-                    env.on_running.remove(pid_to_pause)
-                    env.processes[pid_to_pause].timeline.append((env.timesteps, PSt.PAUSE_RUNNING))
-
-                    env.on_running.append(pid)
-                    env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                    env.preempt(pid_to_pause)
+                    env.dispatch(pid)
 
                     self.schedule_times += 1
 
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        if self._nothing_to_dispatch(env):
+            if not self.is_preemptive or len(env.on_running) < env.n_threads:
+                return math.inf
+            # running jobs only get shorter, so no waiting job can overtake them. ties are left to `schedule`.
+            longest_running = max(env.processes[pid].CPU_TIME_NEEDED for pid in env.on_running)
+            shortest_waiting = env.ready_queue.peek_key()[0] if env.ready_queue else math.inf
+            if longest_running < shortest_waiting:
+                return math.inf
+        return 0
+
 
 class HRRF(SchedulerBase):
     """Highest Response Ratio First"""
+    is_preemptive = False
+
     def schedule(self, env: VirtualEnv) -> None:
         if len(env.on_running) == env.n_threads:
             return
 
         def response_ratio(kv):
-            return (env.timesteps - kv[-1].get_state_timesteps(PSt.CREATE)[0]) / kv[-1].CPU_TIME_NEEDED
+            return (env.timesteps - kv[-1].timeline.created_at) / kv[-1].CPU_TIME_NEEDED
 
-        for pid, _ in sorted(env.processes.items(), key=lambda kv: response_ratio(kv), reverse=True)[:env.n_threads]:
+        for pid, _ in heapq.nlargest(env.n_threads, env.processes.items(), key=response_ratio):
             if pid not in env.on_running and len(env.on_running) < env.n_threads:
-                env.on_running.append(pid)
-                env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                env.dispatch(pid)
 
                 self.schedule_times += 1
 
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        return math.inf if self._nothing_to_dispatch(env) else 0
+
 
 class RR(SchedulerBase):
     """Round-Robin"""
@@ -101,15 +180,12 @@ class RR(SchedulerBase):
                 pid_to_pause.append(pid)
 
         for pid in pid_to_pause:
-            env.on_running.remove(pid)
-            env.processes[pid].timeline.append((env.timesteps, PSt.PAUSE_RUNNING))
-            env.processes.move_to_end(pid)
+            env.preempt(pid, move_to_end=True)
 
         if len(env.on_running) < env.n_threads:
-            for pid in list(env.processes.keys())[:env.n_threads]:
+            for pid in env.head(env.n_threads):
                 if pid not in env.on_running and len(env.on_running) < env.n_threads:
-                    env.on_running.append(pid)
-                    env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                    env.dispatch(pid)
                     env.processes[pid].slice_cnt = self.time_slice
 
                     self.schedule_times += 1
@@ -117,6 +193,14 @@ class RR(SchedulerBase):
         for pid in env.on_running:
             env.processes[pid].slice_cnt -= 1
 
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        if not self._nothing_to_dispatch(env):
+            return 0
+        return self._ticks_until_slice_expires(env)
+
+    def skip(self, env: VirtualEnv, n_ticks: int) -> None:
+        self._consume_slices(env, n_ticks)
+
 
 class SP(SchedulerBase):
     """Static Priority or MQ"""
@@ -128,6 +212,9 @@ class SP(SchedulerBase):
     def wrap_task(self, task: ProcessBase) -> WrappedProcess:
         return WrappedProcess(task, slice_cnt=0, d_prio=task.STATIC_PRIO)
 
+    def ready_key(self, process: WrappedProcess) -> Tuple:
+        return -process.task_base.STATIC_PRIO,
+
     def schedule(self, env: VirtualEnv) -> None:
         pid_to_pause = []
         for pid in env.on_running:
@@ -135,17 +222,14 @@ class SP(SchedulerBase):
                 pid_to_pause.append(pid)
 
         for pid in pid_to_pause:
-            env.on_running.remove(pid)
-            env.processes[pid].timeline.append((env.timesteps, PSt.PAUSE_RUNNING))
-            env.processes.move_to_end(pid)
+            env.preempt(pid, move_to_end=True)
 
         if len(env.on_running) < env.n_threads:
 
-            for pid, process in sorted(
-                    env.processes.items(), key=lambda kv: kv[-1].task_base.STATIC_PRIO, reverse=True)[:env.n_threads]:
+            for pid in env.head(env.n_threads):
+                process = env.processes[pid]
                 if pid not in env.on_running and len(env.on_running) < env.n_threads:
-                    env.on_running.append(pid)
-                    env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                    env.dispatch(pid)
                     time_slices = self.min_time_slice + process.task_base.STATIC_PRIO * self.time_slice_increment
                     env.processes[pid].slice_cnt = time_slices
 
@@ -154,6 +238,14 @@ class SP(SchedulerBase):
         for pid in env.on_running:
             env.processes[pid].slice_cnt -= 1
 
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        if not self._nothing_to_dispatch(env):
+            return 0
+        return self._ticks_until_slice_expires(env)
+
+    def skip(self, env: VirtualEnv, n_ticks: int) -> None:
+        self._consume_slices(env, n_ticks)
+
 
 class DP(SchedulerBase):
     """Dynamic Priority"""
@@ -165,6 +257,9 @@ class DP(SchedulerBase):
     def wrap_task(self, task: ProcessBase) -> WrappedProcess:
         return WrappedProcess(task, slice_cnt=0, d_prio=task.STATIC_PRIO)
 
+    def make_ready_queue(self) -> ReadyQueue:
+        return DynamicPriorityQueue()
+
     def schedule(self, env: VirtualEnv) -> None:
         pid_to_pause = []
         for pid in env.on_running:
@@ -172,21 +267,14 @@ class DP(SchedulerBase):
                 pid_to_pause.append(pid)
 
         for pid in pid_to_pause:
-            env.on_running.remove(pid)
-            env.processes[pid].timeline.append((env.timesteps, PSt.PAUSE_RUNNING))
+            env.preempt(pid)
 
         if len(env.on_running) < env.n_threads:
-            # update dynamic priority
-            for pid, process in env.processes.items():
-                total_time = (env.timesteps - process.get_state_timesteps(PSt.CREATE)[0]) + 1
-                run_time = len(process.get_state_timesteps(PSt.RUNNING)) / total_time
-                wait_time = 1 - run_time
-                env.processes[pid].d_prio = process.task_base.STATIC_PRIO - run_time + wait_time
-
-            for pid, process in sorted(env.processes.items(), key=lambda kv: kv[-1].d_prio, reverse=True)[:env.n_threads]:
+            # the ready queue refreshes d_prio of the processes it has to rank, the rest can't make it anyway.
+            for _, pid in env.ready_queue.top(env.n_threads - len(env.on_running), env):
+                process = env.processes[pid]
                 if pid not in env.on_running and len(env.on_running) < env.n_threads:
-                    env.on_running.append(pid)
-                    env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                    env.dispatch(pid)
                     time_slices = self.min_time_slice + process.task_base.STATIC_PRIO * self.time_slice_increment
                     env.processes[pid].slice_cnt = time_slices
 
@@ -195,6 +283,14 @@ class DP(SchedulerBase):
         for pid in env.on_running:
             env.processes[pid].slice_cnt -= 1
 
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        if not self._nothing_to_dispatch(env):
+            return 0
+        return self._ticks_until_slice_expires(env)
+
+    def skip(self, env: VirtualEnv, n_ticks: int) -> None:
+        self._consume_slices(env, n_ticks)
+
 
 class DPMQ(SchedulerBase):
     """Dynamic Priority Multi-level Queue"""
@@ -206,6 +302,9 @@ class DPMQ(SchedulerBase):
     def wrap_task(self, task: ProcessBase) -> WrappedProcess:
         return WrappedProcess(task, slice_cnt=0, d_prio=task.STATIC_PRIO)
 
+    def make_ready_queue(self) -> ReadyQueue:
+        return DynamicPriorityQueue(level=lambda process: -process.task_base.STATIC_PRIO)
+
     def schedule(self, env: VirtualEnv) -> None:
         pid_to_pause = []
         for pid in env.on_running:
@@ -213,25 +312,14 @@ class DPMQ(SchedulerBase):
                 pid_to_pause.append(pid)
 
         for pid in pid_to_pause:
-            env.on_running.remove(pid)
-            env.processes[pid].timeline.append((env.timesteps, PSt.PAUSE_RUNNING))
+            env.preempt(pid)
 
         if len(env.on_running) < env.n_threads:
-            # update dynamic priority
-            for pid, process in env.processes.items():
-                total_time = (env.timesteps - process.get_state_timesteps(PSt.CREATE)[0]) + 1
-                run_time = len(process.get_state_timesteps(PSt.RUNNING)) / total_time
-                wait_time = 1 - run_time
-                env.processes[pid].d_prio = process.task_base.STATIC_PRIO - run_time + wait_time
-
-            def first_queue_not_empty(kv):
-                # sort by keywords: [STATIC_PRIO, D_PRIO]
-                return kv[-1].task_base.STATIC_PRIO, kv[-1].d_prio
-
-            for pid, process in sorted(env.processes.items(), key=first_queue_not_empty, reverse=True)[:env.n_threads]:
+            # sort by keywords: [STATIC_PRIO, D_PRIO], see `make_ready_queue`.
+            for _, pid in env.ready_queue.top(env.n_threads - len(env.on_running), env):
+                process = env.processes[pid]
                 if pid not in env.on_running and len(env.on_running) < env.n_threads:
-                    env.on_running.append(pid)
-                    env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                    env.dispatch(pid)
                     time_slices = self.min_time_slice + process.task_base.STATIC_PRIO * self.time_slice_increment
                     env.processes[pid].slice_cnt = time_slices
 
@@ -240,6 +328,14 @@ class DPMQ(SchedulerBase):
         for pid in env.on_running:
             env.processes[pid].slice_cnt -= 1
 
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        if not self._nothing_to_dispatch(env):
+            return 0
+        return self._ticks_until_slice_expires(env)
+
+    def skip(self, env: VirtualEnv, n_ticks: int) -> None:
+        self._consume_slices(env, n_ticks)
+
 
 class MFQ(SchedulerBase):
     """Multi-level Feedback Queue"""
@@ -251,42 +347,53 @@ class MFQ(SchedulerBase):
     def wrap_task(self, task: ProcessBase) -> WrappedProcess:
         return WrappedProcess(task, queue_index=0, slice_cnt=0)
 
+    def ready_key(self, process: WrappedProcess) -> Tuple:
+        return process.queue_index,
+
+    def make_ready_queue(self) -> ReadyQueue:
+        return MultiLevelQueue(level=lambda process: process.queue_index)
+
     def schedule(self, env: VirtualEnv) -> None:
         pid_to_pause = []
         for pid in env.on_running:
             if env.processes[pid].slice_cnt == 0:
                 pid_to_pause.append(pid)
 
-        for pid, process in sorted(env.processes.items(), key=lambda kv: kv[-1].queue_index)[:env.n_threads]:
+        for pid in env.head(env.n_threads):
+            process = env.processes[pid]
             if pid not in env.on_running:
                 if env.on_running == env.n_threads:
                     max_queue_pid = max(env.on_running, key=lambda x: env.processes[x].queue_index)
                     if env.processes[max_queue_pid].queue_index > env.processes[pid]:
                         pid_to_pause.append(max_queue_pid)
 
-                        env.on_running.append(pid)
-                        env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                        env.dispatch(pid)
                         env.processes[pid].slice_cnt = self.base_time_slices * 2 ** process.queue_index
 
                         self.schedule_times += 1
 
                 else:
-                    env.on_running.append(pid)
-                    env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                    env.dispatch(pid)
                     env.processes[pid].slice_cnt = self.base_time_slices * 2 ** process.queue_index
 
                     self.schedule_times += 1
 
         for pid in set(pid_to_pause):
-            env.on_running.remove(pid)
-            env.processes[pid].timeline.append((env.timesteps, PSt.PAUSE_RUNNING))
             env.processes[pid].slice_cnt = 0
             env.processes[pid].queue_index = min(self.n_queses, env.processes[pid].queue_index + 1)
-            env.processes.move_to_end(pid)
+            env.preempt(pid, move_to_end=True)
 
         for pid in env.on_running:
             env.processes[pid].slice_cnt -= 1
 
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        if not self._ahead_of_waiting(env):
+            return 0
+        return self._ticks_until_slice_expires(env)
+
+    def skip(self, env: VirtualEnv, n_ticks: int) -> None:
+        self._consume_slices(env, n_ticks)
+
 
 class SPMFQ(SchedulerBase):
     """
@@ -303,21 +410,27 @@ class SPMFQ(SchedulerBase):
     def wrap_task(self, task: ProcessBase) -> WrappedProcess:
         return WrappedProcess(task, queue_index=0, slice_cnt=0)
 
+    def ready_key(self, process: WrappedProcess) -> Tuple:
+        return process.queue_index,
+
+    def make_ready_queue(self) -> ReadyQueue:
+        return MultiLevelQueue(level=lambda process: process.queue_index)
+
     def schedule(self, env: VirtualEnv) -> None:
         pid_to_pause = []
         for pid in env.on_running:
             if env.processes[pid].slice_cnt == 0:
                 pid_to_pause.append(pid)
 
-        for pid, process in sorted(env.processes.items(), key=lambda kv: kv[-1].queue_index)[:env.n_threads]:
+        for pid in env.head(env.n_threads):
+            process = env.processes[pid]
             if pid not in env.on_running:
                 if env.on_running == env.n_threads:
                     max_queue_pid = max(env.on_running, key=lambda x: env.processes[x].queue_index)
                     if env.processes[max_queue_pid].queue_index > env.processes[pid]:
                         pid_to_pause.append(max_queue_pid)
 
-                        env.on_running.append(pid)
-                        env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                        env.dispatch(pid)
                         exp_val = (self.min_exp +
                                    self.exp_increment * process.task_base.STATIC_PRIO) ** process.queue_index
                         env.processes[pid].slice_cnt = int(self.base_time_slices * exp_val)
@@ -325,8 +438,7 @@ class SPMFQ(SchedulerBase):
                         self.schedule_times += 1
 
                 else:
-                    env.on_running.append(pid)
-                    env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                    env.dispatch(pid)
                     exp_val = (self.min_exp +
                                self.exp_increment * process.task_base.STATIC_PRIO) ** process.queue_index
                     env.processes[pid].slice_cnt = int(self.base_time_slices * exp_val)
@@ -334,15 +446,21 @@ class SPMFQ(SchedulerBase):
                     self.schedule_times += 1
 
         for pid in set(pid_to_pause):
-            env.on_running.remove(pid)
-            env.processes[pid].timeline.append((env.timesteps, PSt.PAUSE_RUNNING))
             env.processes[pid].slice_cnt = 0
             env.processes[pid].queue_index = min(self.n_queses, env.processes[pid].queue_index + 1)
-            env.processes.move_to_end(pid)
+            env.preempt(pid, move_to_end=True)
 
         for pid in env.on_running:
             env.processes[pid].slice_cnt -= 1
 
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        if not self._ahead_of_waiting(env):
+            return 0
+        return self._ticks_until_slice_expires(env)
+
+    def skip(self, env: VirtualEnv, n_ticks: int) -> None:
+        self._consume_slices(env, n_ticks)
+
 
 class MPMFQ(SchedulerBase):
     """
@@ -358,27 +476,25 @@ class MPMFQ(SchedulerBase):
     def wrap_task(self, task: ProcessBase) -> WrappedProcess:
         return WrappedProcess(task, queue_index=0, slice_cnt=0, d_prio=task.STATIC_PRIO)
 
+    def make_ready_queue(self) -> ReadyQueue:
+        # within a queue, higher d_prio first.
+        return DynamicPriorityQueue(level=lambda process: process.queue_index)
+
     def schedule(self, env: VirtualEnv) -> None:
         pid_to_pause = []
         for pid in env.on_running:
             if env.processes[pid].slice_cnt == 0:
                 pid_to_pause.append(pid)
 
-        for pid, process in env.processes.items():
-            total_time = (env.timesteps - process.get_state_timesteps(PSt.CREATE)[0]) + 1
-            run_time = len(process.get_state_timesteps(PSt.RUNNING)) / total_time
-            wait_time = 1 - run_time
-            env.processes[pid].d_prio = process.task_base.STATIC_PRIO - run_time + wait_time
-
-        for pid, process in sorted(env.processes.items(), key=lambda kv: (kv[-1].queue_index, -kv[-1].d_prio))[:env.n_threads]:
+        for pid in env.head(env.n_threads):
+            process = env.processes[pid]
             if pid not in env.on_running:
                 if env.on_running == env.n_threads:
                     max_queue_pid = max(env.on_running, key=lambda x: env.processes[x].queue_index)
                     if env.processes[max_queue_pid].queue_index > env.processes[pid]:
                         pid_to_pause.append(max_queue_pid)
 
-                        env.on_running.append(pid)
-                        env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                        env.dispatch(pid)
                         exp_val = (self.min_exp +
                                    self.exp_increment * process.task_base.STATIC_PRIO) ** process.queue_index
                         env.processes[pid].slice_cnt = int(self.base_time_slices * exp_val)
@@ -386,8 +502,7 @@ class MPMFQ(SchedulerBase):
                         self.schedule_times += 1
 
                 else:
-                    env.on_running.append(pid)
-                    env.processes[pid].timeline.append((env.timesteps, PSt.START_RUNNING))
+                    env.dispatch(pid)
                     exp_val = (self.min_exp +
                                self.exp_increment * process.task_base.STATIC_PRIO) ** process.queue_index
                     env.processes[pid].slice_cnt = int(self.base_time_slices * exp_val)
@@ -395,11 +510,89 @@ class MPMFQ(SchedulerBase):
                     self.schedule_times += 1
 
         for pid in set(pid_to_pause):
-            env.on_running.remove(pid)
-            env.processes[pid].timeline.append((env.timesteps, PSt.PAUSE_RUNNING))
             env.processes[pid].slice_cnt = 0
             env.processes[pid].queue_index = min(self.n_queses, env.processes[pid].queue_index + 1)
-            env.processes.move_to_end(pid)
+            env.preempt(pid, move_to_end=True)
+
+        for pid in env.on_running:
+            env.processes[pid].slice_cnt -= 1
+
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        if not self._ahead_of_waiting(env):
+            return 0
+        return self._ticks_until_slice_expires(env)
+
+    def skip(self, env: VirtualEnv, n_ticks: int) -> None:
+        self._consume_slices(env, n_ticks)
+
+
+class CFS(SchedulerBase):
+    """
+    Completely Fair Scheduler
+    run the processes with the least virtual runtime, which grows slower for heavier (higher STATIC_PRIO) ones.
+    each gets its weighted share of target_latency as time slice, at least min_granularity.
+    """
+    NICE_0_WEIGHT = 1024
+    VRUNTIME_SCALE = 1024  # vruntime is kept in integer units, identical across engines.
+
+    def __init__(self, target_latency=24, min_granularity=3, **kwargs):
+        super().__init__()
+        self.target_latency = target_latency
+        self.min_granularity = min_granularity
+
+    @classmethod
+    def weight(cls, static_prio) -> int:
+        # like linux' nice-to-weight table, every priority level is worth 25% more cpu. STATIC_PRIO 4 is nice 0.
+        return max(1, round(cls.NICE_0_WEIGHT * 1.25 ** (static_prio - 4)))
+
+    def wrap_task(self, task: ProcessBase) -> WrappedProcess:
+        weight = self.weight(task.STATIC_PRIO)
+        vruntime_delta = self.NICE_0_WEIGHT * self.VRUNTIME_SCALE // weight  # per tick on cpu
+        return WrappedProcess(task, slice_cnt=0, vruntime=0, weight=weight, vruntime_delta=vruntime_delta)
+
+    def make_ready_queue(self) -> ReadyQueue:
+        return CFSQueue()
+
+    def time_slice(self, env: VirtualEnv, process: WrappedProcess) -> int:
+        share = self.target_latency * env.n_threads * process.weight / env.ready_queue.load
+        return max(self.min_granularity, min(self.target_latency, int(share)))
+
+    def schedule(self, env: VirtualEnv) -> None:
+        queue = env.ready_queue
+        pid_to_pause = []
+        for pid in env.on_running:
+            if env.processes[pid].slice_cnt == 0:
+                pid_to_pause.append(pid)
+
+        for pid in pid_to_pause:
+            process = env.processes[pid]
+            # keep running if nobody waiting is further behind.
+            if queue and queue.peek_key()[0] < process.vruntime:
+                env.preempt(pid, move_to_end=True)
+            else:
+                process.slice_cnt = self.time_slice(env, process)
+
+        while len(env.on_running) < env.n_threads and queue:
+            pid = queue.peek()
+            env.dispatch(pid)
+            env.processes[pid].slice_cnt = self.time_slice(env, env.processes[pid])
+
+            self.schedule_times += 1
+
+        self._account(env, 1)
+
+    def quiet_ticks(self, env: VirtualEnv) -> float:
+        if not self._nothing_to_dispatch(env):
+            return 0
+        return self._ticks_until_slice_expires(env)
+
+    def skip(self, env: VirtualEnv, n_ticks: int) -> None:
+        self._account(env, n_ticks)
 
+    @staticmethod
+    def _account(env: VirtualEnv, n_ticks: int) -> None:
         for pid in env.on_running:
-            env.processes[pid].slice_cnt -= 1
\ No newline at end of file
+            process = env.processes[pid]
+            process.slice_cnt -= n_ticks
+            process.vruntime += n_ticks * process.vruntime_delta
+        env.ready_queue.update_min_vruntime(env.processes[pid].vruntime for pid in env.on_running)
@@ -0,0 +1,132 @@
+import os
+import uuid
+import shutil
+import hashlib
+import itertools
+import numpy as np
+from pathlib import Path
+from typing import *
+from src.utils.workload import Workload, COLUMNS
+
+
+DEFAULT_COLUMNS = dict(arrival='arrival', length='length', prio='prio')
+
+
+def read_trace(
+        path,
+        columns: Dict[str, str] = None,
+        chunksize: int = 1 << 20,
+        default_prio: int = 4,
+        delimiter: str = ',',
+) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    read an arrival log chunk by chunk, never holding more than `chunksize` rows of text.
+    :param path: .csv (with a header row), .parquet (needs pyarrow) or .npz
+    :param columns: `Workload` column -> column name in the log, see `DEFAULT_COLUMNS`.
+        the prio column may be missing, `default_prio` is used then. a missing arrival or length column raises KeyError.
+    :return: chunks of raw float64 columns arrival / length / prio, in file order.
+    """
+    columns = DEFAULT_COLUMNS | (columns or {})
+    suffix = Path(path).suffix.lower()
+    if suffix == '.npz':
+        with np.load(path) as data:
+            _check_columns(columns, data.files, path)
+            n = len(data[columns['arrival']])
+            for lo in range(0, n, chunksize):
+                yield {k: _column(data, name, default_prio, n, lo, lo + chunksize) for k, name in columns.items()}
+    elif suffix == '.parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('reading parquet traces needs pyarrow, `pip install pyarrow` or convert it to csv / npz.')
+        file = pq.ParquetFile(path)
+        _check_columns(columns, file.schema_arrow.names, path)
+        names = [name for name in columns.values() if name in file.schema_arrow.names]
+        for batch in file.iter_batches(batch_size=chunksize, columns=names):
+            data = {name: batch.column(name).to_numpy() for name in names}
+            yield {k: _column(data, name, default_prio, batch.num_rows) for k, name in columns.items()}
+    else:
+        with open(path) as f:
+            header = [name.strip() for name in next(f).split(delimiter)]
+            _check_columns(columns, header, path)
+            usecols = {k: header.index(name) for k, name in columns.items() if name in header}
+            while True:
+                lines = list(itertools.islice(f, chunksize))
+                if not lines:
+                    break
+                table = np.loadtxt(
+                    lines, delimiter=delimiter, usecols=list(usecols.values()), dtype=np.float64, ndmin=2)
+                data = {columns[k]: table[:, i] for i, k in enumerate(usecols.keys())}
+                yield {k: _column(data, name, default_prio, len(table)) for k, name in columns.items()}
+
+
+def _check_columns(columns: Dict[str, str], available: List[str], path):
+    # only prio has a default, a typo in the others would silently turn every arrival / length into a constant.
+    for k in ('arrival', 'length'):
+        if columns[k] not in available:
+            raise KeyError(f'{k} column {columns[k]!r} not in {path}, available: {list(available)}')
+
+
+def _column(data, name, default, n, lo=0, hi=None) -> np.ndarray:
+    if name not in data:
+        return np.full(min(n, hi or n) - lo, default, dtype=np.float64)
+    return np.asarray(data[name][lo:hi], dtype=np.float64)
+
+
+def load_trace(
+        path,
+        columns: Dict[str, str] = None,
+        start: float = None,
+        end: float = None,
+        time_scale: float = 1.0,
+        length_scale: float = 1.0,
+        chunksize: int = 1 << 20,
+        cache_dir=None,
+) -> Workload:
+    """
+    replay a real arrival log as a `Workload`, columnar from end to end, no per-process python objects.
+    :param start, end: keep arrivals in [start, end), in the log's own time unit.
+    :param time_scale: timesteps per log time unit, arrivals become floor((arrival - start) * time_scale).
+        < 1 compresses the log, i.e. raises the load.
+    :param length_scale: timesteps per log cpu demand unit, lengths are rounded up to at least 1 timestep.
+    :param cache_dir: keep the parsed log there as memory-mapped .npy columns, keyed by file, size and mtime,
+        so sweeps over windows and scales parse the log once.
+    """
+    raw = _parse(path, columns, chunksize, cache_dir)
+    keep = np.ones(len(raw), dtype=bool)
+    if start is not None:
+        keep &= raw.arrival >= start
+    if end is not None:
+        keep &= raw.arrival < end
+    arrival, length, prio = raw.arrival[keep], raw.length[keep], raw.prio[keep]
+
+    origin = start if start is not None else (arrival.min() if len(arrival) else 0)
+    arrival = np.floor((arrival - origin) * time_scale).astype(COLUMNS['arrival'])
+    length = np.maximum(np.ceil(length * length_scale), 1).astype(COLUMNS['length'])
+    order = np.argsort(arrival, kind='stable')
+    return Workload(arrival[order], length[order], prio.astype(COLUMNS['prio'])[order])
+
+
+def _parse(path, columns, chunksize, cache_dir) -> Workload:
+    # raw float64 columns of the whole log, memory-mapped from cache_dir if given.
+    def parse():
+        chunks = list(read_trace(path, columns=columns, chunksize=chunksize))
+        return Workload(*(np.concatenate([c[k] for c in chunks]) if chunks else np.zeros(0) for k in COLUMNS))
+
+    if cache_dir is None:
+        return parse()
+
+    stat = os.stat(path)
+    key = repr((str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns, sorted((columns or {}).items())))
+    cached = Path(cache_dir) / f'trace-{hashlib.sha256(key.encode()).hexdigest()[:16]}'
+    if not cached.exists():
+        tmp_path = Path(cache_dir) / f'.tmp-{uuid.uuid4().hex}'
+        raw = parse()
+        tmp_path.mkdir(parents=True)
+        for k in COLUMNS:
+            np.save(tmp_path / f'{k}.npy', getattr(raw, k))
+        try:
+            os.rename(tmp_path, cached)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    return Workload(**{k: np.load(cached / f'{k}.npy', mmap_mode='r') for k in COLUMNS})
@@ -1,116 +1,187 @@
-import random
-import string
 import numpy as np
 import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
 import matplotlib.patches as mpatches
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
 from typing import *
 from src.process.process import ProcessState
 from src.process.wrapped_process import WrappedProcess
+from src.utils.workload import generate_random_processes  # lives next to `Workload` now, still importable from here
 
 
-def random_process_name(length=4):
-    sample = random.sample(string.ascii_letters + string.digits, 62)
-    return ''.join([random.choice(sample) for _ in range(length)])
+STATE_COLORS = {
+    ProcessState.CREATE: "green",
+    ProcessState.START_RUNNING: "gold",
+    ProcessState.RUNNING: "orange",
+    ProcessState.PAUSE_RUNNING: "gainsboro",
+    ProcessState.FINISHED: "red",
+}
+STATE_CODES = {state: code for code, state in enumerate(ProcessState)}
 
 
-def generate_random_processes(
-        n_processes: int = 20, lens_mean_normal: int = 30, lens_std_normal: int = 10, density: float = 5.0,
-):
+def schedule_segments(timelines: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """
-    :param n_processes: amount of processes
-    :param lens_mean_normal: mean of processes
-    :param lens_std_normal: std of processes
-        assume process_length ~ |N(mean, std)|
-    :param density: ≈ cpu_times_needed / time_range of job flow.
-        num of jobs N, at timestep t ~ Poisson(num_processes / time_range)
-    :return: Dict
+    bars of a gantt chart, vectorized over the run-length encoded timelines, one bar per run instead of per tick.
+    CREATE is drawn 1 step earlier, START_RUNNING covers the tick it shares with the first RUNNING one,
+    the final state is a 1 tick bar.
+    :param timelines: `Timeline` of each row.
+    :return: row, start, end and state code (see `STATE_CODES`) of every bar.
     """
-    MIN_PRIO, MAX_PRIO = 1, 9
-    time_range = int((n_processes * lens_mean_normal) / density)
-    num_processes_in_timestep = np.random.poisson(lam=n_processes / time_range, size=(time_range,))
-    start_time = []
-    for i, n in enumerate(num_processes_in_timestep):
-        start_time += [i] * n
-    lens = np.abs(np.random.normal(lens_mean_normal, lens_std_normal, size=(n_processes,))).astype(np.int32) + 1
-    prio = np.random.choice(np.arange(MIN_PRIO, MAX_PRIO), size=n_processes)
-    processes = [
-        (t,{
-            'CPU_TIME_NEEDED_TOTAL': l.item(),
-            'name': random_process_name(),
-            'STATIC_PRIO': p,
-         },) for t, l, p in zip(start_time, lens, prio)
-    ]
-    return sorted(processes, key=lambda x: x[0])
-
-
-def visualize_process_schedule(processes_done: Dict[int, WrappedProcess], show_order='done', top_down=True) -> None:
+    n_runs = np.array([t.n_runs() for t in timelines], dtype=np.int64)
+    if not n_runs.sum():
+        return tuple(np.zeros(0, dtype=np.int64) for _ in range(4))
+    row = np.repeat(np.arange(len(timelines)), n_runs)
+    times, states, offsets = np.concatenate(
+        [np.frombuffer(t.data, dtype=np.int64) for t in timelines if t.data]).reshape(-1, 3).T
+    sizes = np.array([t.size for t in timelines if t.data], dtype=np.int64)
+    ends_at = np.cumsum(n_runs[n_runs > 0])
+    last = np.zeros(len(times), dtype=bool)
+    last[ends_at - 1] = True
+    lengths = np.append(offsets[1:], 0) - offsets
+    lengths[last] = sizes - offsets[last]
+
+    start = times.copy()
+    end = np.append(times[1:], 0)
+    start[states == STATE_CODES[ProcessState.CREATE]] -= 1
+    after_start = np.zeros(len(times), dtype=bool)
+    after_start[1:] = (states[:-1] == STATE_CODES[ProcessState.START_RUNNING]) & ~last[:-1]
+    end[np.append(after_start[1:], False)] += 1
+    # the tick shared with START_RUNNING isn't drawn twice.
+    start[after_start] += 1
+    keep = ~last & ~(after_start & ((states != STATE_CODES[ProcessState.RUNNING]) | (lengths == 1)))
+
+    # final state, only for timelines with more than one run.
+    final = last & ~np.append(True, last[:-1])
+    return (
+        np.concatenate([row[keep], row[final]]),
+        np.concatenate([start[keep], (times + lengths - 1)[final]]),
+        np.concatenate([end[keep], (times + lengths)[final]]),
+        np.concatenate([states[keep], states[final]]).astype(np.int64),
+    )
+
+
+def visualize_process_schedule(
+        processes_done: Dict[int, WrappedProcess],
+        show_order='done',
+        top_down=True,
+        time_range: Tuple[float, float] = None,
+        pids: Iterable[int] = None,
+        path=None,
+        figsize: Tuple[float, float] = None,
+        dpi: int = 100,
+        aggregate: bool = None,
+):
     """
+    gantt chart of a schedule, drawn as one collection per state so it stays fast for thousands of processes.
     :param processes_done: dict, pid: WrappedTask
     :param show_order: 'done' - the moment jobs done. 'arrive' - the moment jobs arrived.
     :param top_down: the processes are top-down ordered or down-top.
-    :return: None
+    :param time_range: only draw [start, end) and the processes alive in it.
+    :param pids: only draw these processes.
+    :param path: save the figure there without any gui backend instead of showing it.
+    :param figsize: default 10 inches wide, 1 inch per process up to 20.
+    :param aggregate: downsample into a (process group x time bin) image, each pixel colored by the state
+        covering most of it. default: only if there are more processes or timesteps than pixels.
+    :return: the figure
     """
     if show_order == 'done':
-        op = reversed if top_down else (lambda x: x)
+        order = list(processes_done.values())
     elif show_order == 'arrive':
-        op = (lambda x: sorted(x, key=lambda v: v['pid'], reverse=top_down))
+        order = sorted(processes_done.values(), key=lambda p: p.task_base.pid)
     else:
         raise ValueError(f'Show_order: {show_order} should be `done` or `arrive`')
-
-    STATE_COLORS = {
-        ProcessState.CREATE: "green",
-        ProcessState.START_RUNNING: "gold",
-        ProcessState.RUNNING: "orange",
-        ProcessState.PAUSE_RUNNING: "gainsboro",
-        ProcessState.FINISHED: "red",
-    }
-
-    processes_done = [
-        {'name': f'Process {p.task_base.name + "(user)" if p.task_base.is_user_task else p.task_base.name} - '
-                 f'S_PRIO={p.task_base.STATIC_PRIO}',
-         'pid': p.task_base.pid,
-         'timeline': p.timeline,
-        } for _, p in processes_done.items()
-    ]
-
-    fig, ax = plt.subplots(figsize=(10, len(processes_done)))
-
-    for i, process in enumerate(op(processes_done)):
-        timeline = process["timeline"]
-
-        skip_next = False
-        for j in range(len(timeline) - 1):
-            if skip_next:
-                skip_next = False
-                continue
-
-            start_time, state = timeline[j]
-            end_time = timeline[j + 1][0]
-
-            # in simulation implementation, state CREATE and START_RUNNING are in the same timestep.
-            # we let CREATE 1 step earlier in visualization.
-            if state is ProcessState.CREATE:
-                start_time = start_time - 1
-            # also, start_running and running can be in the same timestep. skip running in visualization.
-            elif state is ProcessState.START_RUNNING:
-                end_time = end_time + 1
-                skip_next = True
-
-            ax.barh(i, width=end_time - start_time, left=start_time, color=STATE_COLORS[state], edgecolor="black")
-
-        # add final state
-        if len(timeline) > 1:
-            end_time = timeline[-1][0]
-            ax.barh(i, width=1, left=end_time, color=STATE_COLORS[timeline[-1][1]], edgecolor="black")
-
-    ax.set_yticks(range(len(processes_done)))
-    ax.set_yticklabels([p["name"] for p in op(processes_done)])
+    if pids is not None:
+        pids = set(pids)
+        order = [p for p in order if p.task_base.pid in pids]
+    if time_range is not None:
+        order = [
+            p for p in order if p.timeline.created_at - 1 < time_range[1] and
+            (p.timeline.finished_at is None or p.timeline.finished_at + 1 > time_range[0])]
+    # row 0 is drawn at the bottom.
+    if top_down:
+        order.reverse()
+
+    row, start, end, state = schedule_segments([p.timeline for p in order])
+    if time_range is not None:
+        start, end = np.maximum(start, time_range[0]), np.minimum(end, time_range[1])
+        keep = start < end
+        row, start, end, state = row[keep], start[keep], end[keep], state[keep]
+
+    n_rows = len(order)
+    if figsize is None:
+        figsize = (10, min(max(n_rows, 3), 20))
+    if path is None:
+        fig, ax = plt.subplots(figsize=figsize, dpi=dpi)
+    else:
+        fig = Figure(figsize=figsize, dpi=dpi)
+        ax = fig.subplots()
+    colors = list(STATE_COLORS.values())
+
+    t0, t1 = (start.min(), end.max()) if len(start) else (0, 1)
+    max_rows, max_bins = int(figsize[1] * dpi), int(figsize[0] * dpi)
+    if aggregate is None:
+        aggregate = n_rows > max_rows or t1 - t0 > max_bins
+    if aggregate:
+        n_groups, n_bins = min(n_rows, max_rows), int(min(t1 - t0, max_bins))
+        dominant = _dominant_state(row * n_groups // n_rows, start, end, state, t0, t1, n_groups, n_bins)
+        cmap = mcolors.ListedColormap(['white'] + colors)
+        ax.imshow(dominant + 1, cmap=cmap, vmin=0, vmax=len(colors), origin='lower', aspect='auto',
+                  interpolation='nearest', extent=(t0, t1, -0.5, n_rows - 0.5))
+    else:
+        edgecolor = 'black' if len(row) <= 2000 else 'none'
+        for code, color in enumerate(colors):
+            mask = state == code
+            if mask.any():
+                ax.add_collection(PolyCollection(
+                    _bars(row[mask], start[mask], end[mask]), facecolors=color, edgecolors=edgecolor))
+        ax.autoscale_view()
+
+    if n_rows <= 64:
+        ax.set_yticks(range(n_rows))
+        ax.set_yticklabels([
+            f'Process {p.task_base.name + "(user)" if p.task_base.is_user_task else p.task_base.name} - '
+            f'S_PRIO={p.task_base.STATIC_PRIO}' for p in order])
+    else:
+        ax.set_ylabel(f'{n_rows} processes, by {show_order}')
     ax.set_xlabel("Time")
     ax.set_title("Process Scheduling Visualization")
 
     legend_handles = [mpatches.Patch(color=color, label=state.value) for state, color in STATE_COLORS.items()]
     ax.legend(handles=legend_handles, title="Process States", loc="upper right")
 
-    plt.tight_layout()
-    plt.grid(axis='x', linestyle='--', color='black')
-    plt.show()
\ No newline at end of file
+    fig.tight_layout()
+    ax.grid(axis='x', linestyle='--', color='black')
+    if path is None:
+        plt.show()
+    else:
+        fig.savefig(path)
+    return fig
+
+
+def _bars(row, start, end) -> np.ndarray:
+    # (n, 4, 2) rectangle vertices, the same 0.8 height as `barh`.
+    x = np.stack([start, start, end, end], axis=1)
+    y = row[:, None] + np.array([-0.4, 0.4, 0.4, -0.4])
+    return np.stack([x, y], axis=2)
+
+
+def _dominant_state(group, start, end, state, t0, t1, n_groups, n_bins) -> np.ndarray:
+    # (n_groups, n_bins) code of the state covering most of each cell, -1 if none.
+    n_states = len(STATE_COLORS)
+    a = (start - t0) * n_bins / (t1 - t0)
+    b = (end - t0) * n_bins / (t1 - t0)
+    ia, ib = np.floor(a).astype(np.int64), np.minimum(np.floor(b).astype(np.int64), n_bins)
+    base = (group * n_states + state) * (n_bins + 1)
+    size = n_groups * n_states * (n_bins + 1)
+    same = ia == ib
+    # partial first and last bins, then +1 over the full bins in between via a difference array.
+    partial = np.bincount(base[same] + ia[same], weights=(b - a)[same], minlength=size)
+    partial += np.bincount(base[~same] + ia[~same], weights=(ia + 1 - a)[~same], minlength=size)
+    partial += np.bincount(base[~same] + ib[~same], weights=(b - ib)[~same], minlength=size)
+    full = ~same & (ib > ia + 1)
+    diff = np.bincount(base[full] + ia[full] + 1, minlength=size) - np.bincount(base[full] + ib[full], minlength=size)
+    coverage = partial.reshape(n_groups, n_states, n_bins + 1) + np.cumsum(
+        diff.reshape(n_groups, n_states, n_bins + 1), axis=2)
+    coverage = coverage[:, :, :n_bins]
+    return np.where(coverage.max(axis=1) > 0, coverage.argmax(axis=1), -1)
@@ -0,0 +1,289 @@
+import os
+import uuid
+import random
+import string
+import shutil
+import numbers
+import hashlib
+import numpy as np
+from pathlib import Path
+from typing import *
+
+
+COLUMNS = {
+    'arrival': np.int64,
+    'length': np.int32,
+    'prio': np.int16,
+}
+MIN_PRIO, MAX_PRIO = 1, 9
+NAME_CHARS = string.ascii_letters + string.digits
+MAX_LENGTH = np.iinfo(COLUMNS['length']).max - 1
+
+
+def param_values(params: Dict) -> List[Tuple[str, Any]]:
+    """sorted (name, value) of generator params, numbers as floats so that 10 and 10.0 are the same workload."""
+    return sorted((k, float(v) if isinstance(v, numbers.Real) else v) for k, v in params.items())
+
+
+def process_name(name_key: int, index: int, length=4) -> str:
+    """name of the `index`-th process of a workload, scrambled from (name_key, index) instead of stored."""
+    x = (name_key ^ (index * 0x9E3779B97F4A7C15)) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 31)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    x ^= x >> 29
+    chars = []
+    for _ in range(length):
+        x, c = divmod(x, len(NAME_CHARS))
+        chars.append(NAME_CHARS[c])
+    return ''.join(chars)
+
+
+class ArrivalProcess:
+    """
+    Number of arrivals in each timestep, `rate` on average. `poisson`: a constant rate. `mmpp`: markov modulated,
+    the rate switches between a low and a `burst_ratio` times higher one, each kept for `mean_dwell` timesteps on
+    average. `onoff`: bursts at rate / `on_fraction` for `mean_dwell` timesteps, silent for the rest of the time.
+    the modulating state carries over between calls, so a workload can be drawn window by window.
+    """
+
+    def __init__(self, rate, arrivals='poisson', burst_ratio=10., on_fraction=0.2, mean_dwell=100.):
+        self.rate = rate
+        self.arrivals = arrivals
+        if arrivals == 'poisson':
+            self.rates, self.dwell = np.array([rate, rate]), np.array([np.inf, np.inf])
+        elif arrivals == 'mmpp':
+            low = 2 * rate / (1 + burst_ratio)
+            self.rates, self.dwell = np.array([low, low * burst_ratio]), np.array([mean_dwell, mean_dwell])
+        elif arrivals == 'onoff':
+            self.rates = np.array([0., rate / on_fraction])
+            self.dwell = np.array([mean_dwell * (1 - on_fraction) / on_fraction, mean_dwell])
+        else:
+            raise ValueError(f'arrivals: {arrivals} should be `poisson`, `mmpp` or `onoff`')
+        self.state = None  # of the modulating chain, drawn at the first call
+        self.left = 0  # timesteps the current state still lasts
+
+    def counts(self, n_timesteps: int) -> np.ndarray:
+        """arrivals in each of the next `n_timesteps` timesteps."""
+        if self.arrivals == 'poisson':
+            return np.random.poisson(lam=self.rate, size=(n_timesteps,))
+        rates, lengths = self._periods(n_timesteps)
+        return np.random.poisson(np.repeat(rates, lengths))
+
+    def times(self, start: int, n_timesteps: int) -> np.ndarray:
+        """
+        sorted arrival timesteps in the next `n_timesteps`, starting at `start`. same distribution as `counts`,
+        drawn per constant rate period instead of per timestep, so long quiet spans cost nothing.
+        """
+        rates, lengths = self._periods(n_timesteps)
+        n = np.random.poisson(rates * lengths)
+        period_start = np.cumsum(lengths) - lengths
+        offsets = (np.random.random(n.sum()) * np.repeat(lengths, n)).astype(COLUMNS['arrival'])
+        return np.sort(np.repeat(start + period_start, n) + offsets)
+
+    def _periods(self, n_timesteps: int) -> Tuple[np.ndarray, np.ndarray]:
+        # rate and length of each constant rate period of the next `n_timesteps`.
+        if self.arrivals == 'poisson':
+            return self.rates[:1], np.array([n_timesteps])
+        if self.state is None:
+            # the chain starts in its stationary distribution, the state before the first one is the other one.
+            self.state = int(np.random.random() >= self.dwell[0] / self.dwell.sum()) ^ 1
+        states, lengths = [np.array([self.state])], [np.array([self.left])]
+        n_drawn = self.left
+        while n_drawn < n_timesteps:
+            # a batch of alternating periods with geometric lengths, enough for the rest on average.
+            k = int((n_timesteps - n_drawn) / self.dwell.mean()) + 2
+            batch = (states[-1][-1] + 1 + np.arange(k)) % 2
+            states.append(batch)
+            lengths.append(np.random.geometric(np.minimum(1 / self.dwell[batch], 1.)))
+            n_drawn += int(lengths[-1].sum())
+        states, lengths = np.concatenate(states), np.concatenate(lengths)
+        ends = np.cumsum(lengths)
+        last = int(np.searchsorted(ends, n_timesteps))
+        self.state, self.left = int(states[last]), int(ends[last] - n_timesteps)
+        lengths[last] -= self.left
+        return self.rates[states[:last + 1]], lengths[:last + 1]
+
+
+def job_lengths(n, mean, std, lengths='normal', pareto_alpha=1.5) -> np.ndarray:
+    """
+    cpu time needed by `n` processes, at least 1. `normal`: |N(mean, std)|. `lognormal`: with that mean and std.
+    `pareto`: heavy tailed with that mean and tail index `pareto_alpha` (> 1), std doesn't apply.
+    """
+    if lengths == 'normal':
+        return np.abs(np.random.normal(mean, std, size=(n,))).astype(np.int32) + 1
+    if lengths == 'lognormal':
+        sigma2 = np.log1p((std / mean) ** 2)
+        x = np.random.lognormal(np.log(mean) - sigma2 / 2, np.sqrt(sigma2), size=(n,))
+    elif lengths == 'pareto':
+        x = (np.random.pareto(pareto_alpha, size=(n,)) + 1) * mean * (pareto_alpha - 1) / pareto_alpha
+    else:
+        raise ValueError(f'lengths: {lengths} should be `normal`, `lognormal` or `pareto`')
+    return np.minimum(x, MAX_LENGTH).astype(np.int32) + 1
+
+
+class Workload:
+    """
+    Columnar workload: arrival timestep, cpu time needed and static priority of each process, sorted by arrival.
+    reads like the `test_processes` list of `generate_random_processes`, (t, process kwargs) built on access,
+    so it can be handed to `benchmark_single` as is, memory-mapped or not.
+    """
+
+    def __init__(self, arrival, length, prio, name_key: int = None, name_index: range = None):
+        """
+        :param name_key: give processes a `process_name`, made on access. unnamed if None.
+        :param name_index: index of each process among all those named with `name_key`, range(len) by default.
+        """
+        self.arrival = arrival
+        self.length = length
+        self.prio = prio
+        self.name_key = name_key
+        self.name_index = name_index if name_index is not None or name_key is None else range(len(arrival))
+
+    @classmethod
+    def from_processes(cls, test_processes: List) -> 'Workload':
+        return cls(
+            arrival=np.array([t for t, _ in test_processes], dtype=COLUMNS['arrival']),
+            length=np.array([p['CPU_TIME_NEEDED_TOTAL'] for _, p in test_processes], dtype=COLUMNS['length']),
+            prio=np.array([p.get('STATIC_PRIO', 4) for _, p in test_processes], dtype=COLUMNS['prio']),
+        )
+
+    @classmethod
+    def load(cls, path, mmap=True) -> 'Workload':
+        mmap_mode = 'r' if mmap else None
+        workload = cls(**{k: np.load(Path(path) / f'{k}.npy', mmap_mode=mmap_mode) for k in COLUMNS.keys()})
+        if (Path(path) / 'names.npy').exists():
+            name_key, start, stop, step = (int(x) for x in np.load(Path(path) / 'names.npy'))
+            workload.name_key, workload.name_index = name_key, range(start, stop, step)
+        return workload
+
+    def save(self, path):
+        Path(path).mkdir(parents=True, exist_ok=True)
+        for k, dtype in COLUMNS.items():
+            np.save(Path(path) / f'{k}.npy', np.asarray(getattr(self, k), dtype=dtype))
+        if self.name_key is not None:
+            # names are made from (name_key, index) on access, these are all it takes to restore them.
+            index = self.name_index
+            np.save(Path(path) / 'names.npy', np.array(
+                [self.name_key, index.start, index.stop, index.step], dtype=np.uint64))
+
+    def __len__(self):
+        return len(self.arrival)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Workload(
+                self.arrival[index], self.length[index], self.prio[index],
+                self.name_key, self.name_index[index] if self.name_key is not None else None)
+        process = dict(
+            CPU_TIME_NEEDED_TOTAL=int(self.length[index]),
+            STATIC_PRIO=int(self.prio[index]),
+        )
+        if self.name_key is not None:
+            process['name'] = process_name(self.name_key, self.name_index[index])
+        return int(self.arrival[index]), process
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def generate_random_processes(
+        n_processes: int = 20, lens_mean_normal: int = 30, lens_std_normal: int = 10, density: float = 5.0,
+        lengths: str = 'normal', arrivals: str = 'poisson', **model,
+) -> Workload:
+    """
+    :param n_processes: amount of processes
+    :param lens_mean_normal: mean of processes
+    :param lens_std_normal: std of processes
+        assume process_length ~ |N(mean, std)|, or see `job_lengths` for heavy tailed `lengths`.
+    :param density: ≈ cpu_times_needed / time_range of job flow.
+        num of jobs N, at timestep t ~ Poisson(num_processes / time_range), or see `ArrivalProcess` for bursty
+        `arrivals`. those bursty ones are drawn past time_range if needed, so that exactly n_processes arrive.
+    :param model: pareto_alpha of `job_lengths`, burst_ratio / on_fraction / mean_dwell of `ArrivalProcess`.
+    :return: Workload, named processes sorted by arrival.
+    """
+    pareto_alpha = model.pop('pareto_alpha', 1.5)
+    time_range = int((n_processes * lens_mean_normal) / density)
+    arrival_process = ArrivalProcess(n_processes / time_range, arrivals, **model)
+    counts = arrival_process.counts(time_range)
+    arrival = np.repeat(np.arange(time_range, dtype=COLUMNS['arrival']), counts)[:n_processes]
+    end = time_range
+    while arrivals != 'poisson' and len(arrival) < n_processes:
+        # silent spans of a bursty source may leave a short range (nearly) empty, keep going until all arrived.
+        arrival = np.concatenate([arrival, arrival_process.times(end, time_range)])[:n_processes]
+        end += time_range
+    length = job_lengths(n_processes, lens_mean_normal, lens_std_normal, lengths, pareto_alpha)[:len(arrival)]
+    prio = np.random.choice(np.arange(MIN_PRIO, MAX_PRIO), size=n_processes)[:len(arrival)]
+    return Workload(arrival, length, prio.astype(COLUMNS['prio']), name_key=random.getrandbits(64))
+
+
+def generate_workload_chunks(
+        n_processes: int = 20, lens_mean_normal: int = 30, lens_std_normal: int = 10, density: float = 5.0,
+        lengths: str = 'normal', arrivals: str = 'poisson', chunk_size: int = 1 << 20, **model,
+) -> Iterator[Workload]:
+    """
+    `generate_random_processes`, drawn and handed out about `chunk_size` processes at a time, so workloads of 10^7+
+    processes never have to be in memory at once. chain them into arrivals for `benchmark_single`:
+    `itertools.chain.from_iterable(generate_workload_chunks(...))`, with `streaming=True`.
+    same distributions, but not the same draws as `generate_random_processes` with the same seed.
+    """
+    pareto_alpha = model.pop('pareto_alpha', 1.5)
+    time_range = int((n_processes * lens_mean_normal) / density)
+    rate = n_processes / time_range
+    arrival_process = ArrivalProcess(rate, arrivals, **model)
+    window = max(1, int(chunk_size / rate))
+    name_key = random.getrandbits(64)
+    n_drawn, start = 0, 0
+    # like `generate_random_processes`, bursty sources go on past time_range until all processes arrived.
+    while n_drawn < n_processes and (start < time_range or arrivals != 'poisson'):
+        size = min(window, time_range - start) if start < time_range else window
+        arrival = arrival_process.times(start, size)[:n_processes - n_drawn]
+        start += size
+        n = len(arrival)
+        if not n:
+            continue
+        yield Workload(
+            arrival,
+            job_lengths(n, lens_mean_normal, lens_std_normal, lengths, pareto_alpha),
+            np.random.choice(np.arange(MIN_PRIO, MAX_PRIO), size=n).astype(COLUMNS['prio']),
+            name_key=name_key,
+            name_index=range(n_drawn, n_drawn + n),
+        )
+        n_drawn += n
+
+
+class WorkloadCorpus:
+    """
+    On-disk cache of generated workloads, one directory of .npy columns per (generator params, seed).
+    every workload is generated once and then opened memory-mapped, so sweep workers share the page cache
+    instead of regenerating or unpickling it.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(params: Dict, seed: int) -> str:
+        key = repr((param_values(params), seed))
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def get(self, params: Dict, seed: int, generate: Callable = generate_random_processes) -> Workload:
+        """
+        :param params: kwargs of `generate`
+        :param generate: workload generator, seeded through `random` and `np.random`.
+        """
+        path = self.root / self.key(params, seed)
+        if not path.exists():
+            random.seed(seed)
+            np.random.seed(seed)
+            workload = generate(**params)
+            if not isinstance(workload, Workload):
+                workload = Workload.from_processes(workload)
+            # write aside and rename, concurrent workers may race for the same workload.
+            tmp_path = self.root / f'.tmp-{uuid.uuid4().hex}'
+            workload.save(tmp_path)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        return Workload.load(path)